@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Depends: emmet, test_emmet
+#
+# MIT License
+#
+# Copyright (c) 2016 Jan Christoph Ebersbach
+# Homepage  http://www.e-jc.de/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Benchmark of the emmet engine outside of vim.  The vim module is replaced by
+# a stub without any variables, the shipped html configuration is used.  Usage:
+#
+#   python3 pythonx/bench_emmet.py -o bench.json
+#   python3 pythonx/bench_emmet.py --check
+#   python3 pythonx/bench_emmet.py --memory
+
+import sys
+import time
+import types
+
+
+def stub_vim():
+	"""
+	Install a vim module that only provides an empty vim.vars, the engine's
+	shipped configuration is used.  vim.eval is only used for the
+	fingerprint of the configuration variables.
+	"""
+	vim = types.ModuleType('vim')
+	vim.vars = {}
+	vim.eval = lambda expr: repr(vim.vars)
+	sys.modules['vim'] = vim
+	return vim
+
+
+class Snip():
+	"""
+	Minimal stand-in for UltiSnips' SnippetUtil as used by emmet.write
+	"""
+	def __init__(self, ft='html'):
+		self.ft = ft
+		self.rv = ''
+		self.indent = ''
+
+	def __iadd__(self, line):
+		self.rv += '\n' + self.mkline(line)
+		return self
+
+	def mkline(self, line='', indent=None):
+		return (self.indent if indent is None else indent) + line
+
+	def shift(self, amount=1):
+		self.indent += '    ' * amount
+
+	def reset_indent(self):
+		self.indent = ''
+
+
+def scaling_cases(sizes):
+	"""
+	Synthetic stress cases, yields (name, abbreviation) tuples
+	"""
+	for n in sizes:
+		yield 'deep nesting %d' % n, 'div>' * n + 'p'
+		yield 'wide siblings %d' % n, '+'.join(['p.item'] * n)
+		yield 'multiplication %d' % n, 'ul>li.item$*%d>a{Item $}' % n
+		yield 'nested multiplication %d' % n, 'table>tr*%d>td.c$*10{$$}' % n
+		yield 'grouped multiplication %d' % n, 'table>(tr>td.c$*10{$$})*%d' % n
+		yield 'long text %d' % n, 'p{%s}' % ('lorem $ ' * n)
+		yield 'attributes %d' % n, 'div[%s]' % ' '.join(
+				['data-a%d="value %d"' % (i, i) for i in range(n)])
+		yield 'mixed attributes %d' % n, 'td[%s]*3' % ' '.join(
+				['t%d="nr $" c%d=%d v%d' % (i, i, i, i) for i in range(n // 3)])
+
+
+def memory_cases():
+	"""
+	Cases of the memory measurement with 10,000 elements each, yields (name,
+	abbreviation) tuples
+	"""
+	yield 'distinct tags 10000', '+'.join(['p.a.b#i{t}'] * 5000 + ['a'] * 5000)
+	yield 'multiplication 10000', 'ul>li.item$*5000>a{x}'
+
+
+def memory(emmet, name, abbreviation):
+	"""
+	Memory of the parsed tree of the abbreviation in bytes, measured with
+	tracemalloc.  The abbreviation is parsed once beforehand, the caches of
+	the engine don't count.
+	"""
+	import tracemalloc
+	profile = emmet._profile('html')
+	emmet.parse(abbreviation, profile)
+	tracemalloc.start()
+	try:
+		before = tracemalloc.get_traced_memory()[0]
+		e = emmet.parse(abbreviation, profile)
+		tree = tracemalloc.get_traced_memory()[0] - before
+	finally:
+		tracemalloc.stop()
+	size = emmet._size(e)
+	return {
+			'case': name,
+			'length': len(abbreviation),
+			'tags': size['tags'],
+			'elements': size['elements'],
+			'tree': tree,
+			'tree per tag': tree // size['tags'],
+			}
+
+
+def measure(f, repeat):
+	"""
+	Best wall time of repeat calls of f in seconds
+	"""
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		f()
+		t = time.perf_counter() - start
+		if best is None or t < best:
+			best = t
+	return best
+
+
+def bench(emmet, name, abbreviation, repeat):
+	"""
+	Time the phases of a single expansion and of typing it character by
+	character.  render is the single pass that produces the preview and the
+	jump text, preview is the update of the snippet by write, update is the
+	same after the abbreviation without its last character was shown and
+	jumps is the assembly of the text for post_jump.  compile and template are the
+	compilation of the parsed abbreviation and the rendering of the result.
+	"""
+	profile = emmet._profile('html')
+	e = emmet.parse(abbreviation, profile)
+	x = emmet.Expansion(e)
+	tpl = emmet.Template.compile(e)
+	shown = emmet._append(Snip(), emmet.Expansion(
+		emmet.parse(abbreviation[:-1] or abbreviation, profile)).preview)
+
+	def keystrokes():
+		p = emmet.Parser(profile)
+		for i in range(1, len(abbreviation) + 1):
+			emmet.Expansion(p.parse(abbreviation[:i]))
+
+	def preview():
+		emmet._append(Snip(), x.preview)
+
+	def update():
+		emmet._append(Snip(), x.preview, shown)
+
+	def jumps():
+		x._jumps = None
+		x.jumps
+
+	res = {
+			'case': name,
+			'length': len(abbreviation),
+			'lines': len(x.lines),
+			'parse': measure(lambda: emmet.parse(abbreviation, profile), repeat),
+			'render': measure(lambda: emmet.Expansion(e), repeat),
+			'compile': measure(lambda: emmet.Template.compile(e), repeat),
+			'template': measure(lambda: emmet.Expansion(tpl), repeat),
+			'preview': measure(preview, repeat),
+			'update': measure(update, repeat),
+			'jumps': measure(jumps, repeat),
+			}
+	if len(abbreviation) <= 1000:
+		res['keystroke'] = measure(keystrokes, max(1, repeat // 5)) / len(abbreviation)
+	return res
+
+
+def check(emmet, tests):
+	"""
+	Compare the output of all renderers with the expectations of test_emmet
+	"""
+	import test_emmet
+	failures = []
+	for k, v in tests.items():
+		if isinstance(v, type):
+			if not test_emmet.rejected(k, 'html', v):
+				failures.append({'case': k, 'renderer': 'parse',
+					'expected': v.__name__, 'got': 'accepted'})
+			continue
+		for renderer, r, jr in test_emmet.results(k, 'html'):
+			if (r, jr) != v:
+				failures.append({'case': k, 'renderer': renderer,
+					'expected': v, 'got': (r, jr)})
+	return failures
+
+
+def main(argv=None):
+	import argparse
+	import json
+	import os
+	import platform
+
+	parser = argparse.ArgumentParser(description='Benchmark the emmet engine.')
+	parser.add_argument('-o', '--output', help='write JSON results to file, default: stdout')
+	parser.add_argument('-r', '--repeat', type=int, default=20,
+			help='number of runs per case, the best run is reported')
+	parser.add_argument('-s', '--sizes', default='10,100,1000',
+			help='comma separated sizes of the scaling cases')
+	parser.add_argument('-k', '--filter', default='',
+			help='only run cases whose name contains this string')
+	parser.add_argument('--memory', action='store_true',
+			help='only measure the memory of the parsed tree of 10,000 elements')
+	parser.add_argument('--check', action='store_true',
+			help='only compare the output with the expectations of test_emmet')
+	args = parser.parse_args(argv)
+
+	stub_vim()
+	sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+	import emmet
+	import test_emmet
+
+	if args.check:
+		failures = check(emmet, test_emmet.tests)
+		json.dump({'tests': len(test_emmet.tests), 'failures': failures},
+				sys.stdout, indent=1)
+		sys.stdout.write('\n')
+		return 1 if failures else 0
+
+	if args.memory:
+		out = {
+				'python': platform.python_version(),
+				'unit': 'bytes',
+				'results': [memory(emmet, name, a) for name, a in memory_cases()
+					if args.filter in name],
+				}
+	else:
+		cases = [('test %s' % k, k) for k in sorted(test_emmet.tests)
+				if not isinstance(test_emmet.tests[k], type)]
+		cases += list(scaling_cases([int(n) for n in args.sizes.split(',') if n]))
+		results = [bench(emmet, name, a, args.repeat) for name, a in cases
+				if args.filter in name]
+		out = {
+				'python': platform.python_version(),
+				'repeat': args.repeat,
+				'unit': 'seconds',
+				'results': results,
+				}
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(out, f, indent=1)
+	else:
+		json.dump(out, sys.stdout, indent=1)
+		sys.stdout.write('\n')
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -26,20 +26,14 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-
-# wrapper function for stacking multiple "attach at parent tag" operations
-def stack_parents(o):
-	def attach_at_parent(ct, s):
-		t = o(ct, s)
-		if issubclass(t.__class__, TagList):
-			for obj in t:
-				obj.parent < obj
-				obj.parent.parent > obj
-		else:
-			t.parent < t
-			t.parent.parent > t
-		return t
-	return attach_at_parent
+import collections
+import functools
+import itertools
+import operator
+import os
+import re
+import threading
+import time
 
 
 # Emmet syntax objects and that directly implement the required functionality
@@ -47,12 +41,14 @@ O_C_ATTR     = '['
 O_C_ATTR_END = ']'
 O_TEXT       = '{'
 O_TEXT_END   = '}'
+O_GROUP      = '('
+O_GROUP_END  = ')'
 
 operators = {
-	# positioning
-	'>': lambda ct, s: ct > Tag(s),  # child
-	'+': lambda ct, s: ct.parent > Tag(s),  # sibling
-	'^': lambda ct, s: ct.parent.parent > Tag(s) if not callable(ct) else stack_parents(ct),  # parent
+	# positioning, handled by the parser
+	'>': None,  # child
+	'+': None,  # sibling
+	'^': None,  # parent
 
 	# attributes and special attributes
 	'#': lambda ct, s: ct + Attribute('id', s),  # attribute
@@ -66,65 +62,139 @@ operators = {
 	O_TEXT_END: None,
 
 	# operation applies to one or multiple tags and even tag structures
-	'*': lambda ct, s: TagList([ct.setmul(end=int(s))] + \
-			[ct.parent > ct.clone(i) for i in range(2, int(s) + 1)]) \
-			if not issubclass(ct.__class__, TagList) else \
-			ct.clone(int(s)),  # multiplication
+	'*': lambda ct, s: ct.setmul(_count(s)),  # multiplication
 
-	'(': None,  # grouping
-	')': None,
-
-	# in combination with multiplication
-	'@-': None,  # change direction of numbering
-	'@[0-9]*': None,  # change number to start with
+	# grouping, handled by the parser
+	O_GROUP:     None,
+	O_GROUP_END: None,
 }
 
 
+def _count(s):
+	"""
+	Number of copies of a multiplication, every renderer and the estimate
+	expect at least one
+	"""
+	n = int(s)
+	if n < 1:
+		raise ValueError('multiplication by %d, at least 1 is required' % n)
+	return n
+
+
+# text and custom attributes are read as a whole, everything up to the closing
+# bracket belongs to them.  Names end at operators and whitespace, whitespace
+# outside of brackets is ignored.
+TOKENS = re.compile(r'''
+	\{(?P<text>[^}]*)
+	|\[(?P<attrs>[^\]]*)
+	|(?P<name>[^\s>+^#.*(){}\[\]]+)
+	|(?P<op>\S)
+	|\s+
+	''', re.X)
+
+
+def tokenize(emmet, pos=0):
+	"""
+	Split the user's input into tokens, starting at pos.  A token is an
+	(operator, string, end position) tuple, operator is None for names.  Text
+	and custom attributes result in the opening bracket as operator and their
+	content as string.
+	"""
+	tokens = []
+	for m in TOKENS.finditer(emmet, pos):
+		text, attrs, name, op = m.groups()
+		if text is not None:
+			tokens.append((O_TEXT, text, m.end()))
+		elif attrs is not None:
+			tokens.append((O_C_ATTR, attrs, m.end()))
+		elif name:
+			tokens.append((None, name, m.end()))
+		elif op:
+			tokens.append((op, '', m.end()))
+	return tokens
+
+
+# counter with optional modifiers: @- reverses the numbering, @N starts it at N
+NUMBERING = re.compile(r'(\$+(?:@-?[0-9]*)?)')
+
+
+def _counter(v):
+	"""
+	Compile a counter, a plain one is represented by its padding, one with
+	modifiers by a (padding, reverse, base) tuple
+	"""
+	pad, _, mod = v.partition('@')
+	if not _:
+		return len(pad)
+	reverse = mod.startswith('-')
+	base = mod.lstrip('-')
+	return (len(pad), reverse, int(base) if base else 1)
+
+
+def _compile(value):
+	"""
+	Compile a value containing item numbering into a tuple of literal strings
+	and counters.  Values without item numbering stay plain strings.
+	"""
+	if '$' not in value:
+		return value
+	return tuple(_counter(v) if v[0] == '$' else v for v in NUMBERING.split(value) if v)
+
+
+def _number(value, mul, total=1):
+	"""
+	Substitute mul for the counters of a compiled value, total is the number
+	of copies that are numbered
+	"""
+	if value.__class__ is str:
+		return value
+	res = []
+	for v in value:
+		if v.__class__ is str:
+			res.append(v)
+		elif v.__class__ is int:
+			res.append('%0*d' % (v, mul))
+		else:
+			res.append('%0*d' % (v[0], v[2] + total - mul if v[1] else v[2] + mul - 1))
+	return ''.join(res)
+
+
 class Text():
 	"""
 	Representation of text
 	"""
-	def __init__(self, value=''):
-		self.value = value
+	__slots__ = ('value', )
 
-	def clone(self):
-		t = self.__class__(self.value)
-		return t
+	def __init__(self, value=''):
+		self.value = _compile(value)
 
-	def tostr(self, jm, mul=1):
-		nv = ''
-		pad = 0
-		for c in self.value:
-			if pad and c != '$':
-				nv += ('%0' + str(pad) + 'd') % mul
-				pad = 0
-			if c == '$':
-				pad += 1
-			else:
-				nv += c
-		if pad:
-			nv += ('%0' + str(pad) + 'd') % mul
+	def tostr(self, jm, mul=1, total=1):
+		nv = _number(self.value, mul, total)
 		jm.inc
-		return '%s' % nv \
-				if not jm.count else \
-				'${%d:%s}' % (jm.c, nv) if nv else '$%d' % jm.c
+		return nv, '${%d:%s}' % (jm.c, nv) if nv else '$%d' % jm.c
 
 
 class Attribute():
 	"""
-	Representation of a single attribute that belongs to a tag
+	Representation of a single attribute that belongs to a tag.  The value is
+	a compiled value or, in case of multiple classes, a list of compiled
+	values.
 	"""
+	__slots__ = ('name', 'value')
+
 	def __init__(self, name, value=''):
 		self.name = name
 		if type(value) == list:
-			self.value = value
+			self.value = [_compile(v) for v in value]
 		else:
-			self.value = [value]
+			self.value = _compile(value)
 
 	def __add__(self, a):
 		if a == self:
 			if self.name == 'class':
-				self.value += a.value
+				if self.value.__class__ is not list:
+					self.value = [self.value]
+				self.value += a.value if a.value.__class__ is list else [a.value]
 			else:
 				self.value = a.value
 		return self
@@ -132,35 +202,14 @@ class Attribute():
 	def __eq__(self, a):
 		return a and a.name == self.name
 
-	def clone(self):
-		a = self.__class__(self.name, self.value[:])
-		return a
-
-	def tostr(self, jm, mul=1):
-		res = []
-		for v in self.value:
-			nv = ''
-			pad = 0
-			for c in v:
-				if pad and c != '$':
-					nv += ('%0' + str(pad) + 'd') % mul
-					pad = 0
-				if c == '$':
-					pad += 1
-				else:
-					nv += c
-			if pad:
-				nv += ('%0' + str(pad) + 'd') % mul
-			if nv:
-				res.append(nv)
+	def tostr(self, jm, mul=1, total=1):
+		if self.value.__class__ is list:
+			nv = ' '.join([v for v in [_number(v, mul, total) for v in self.value] if v])
+		else:
+			nv = _number(self.value, mul, total)
 		jm.inc
-		return '%(name)s="%(value)s"' % {
-			'name': self.name,
-			'value': \
-				' '.join(res) \
-				if not jm.count else \
-				'${%d:%s}' % (jm.c, ' '.join(res)) if res else '$%d' % jm.c
-			}
+		return '%s="%s"' % (self.name, nv), \
+				'%s="%s"' % (self.name, '${%d:%s}' % (jm.c, nv) if nv else '$%d' % jm.c)
 
 
 	@classmethod
@@ -168,79 +217,60 @@ class Attribute():
 		"""
 		Parse string into attributes
 		"""
-		attrs = []
-		a = '' # attribute
-		v = '' # value
-		q = '' # quote string
-		i = '' # incomplete string
-		for c in s:
-			if c in ('"', "'"):
-				if not a:
-					continue
-				if not q:
-					q = c
-					continue
-				if q and q == c:
-					q = ''
-					if not a:
-						i = ''
-						continue
-					v = i
-					i = ''
-					attrs.append(Attribute(a, v))
-					a = ''
-					v = ''
-					continue
-			elif c == '=':
-				if not i:
-					continue
-				a = i
-				i = ''
-			else:
-				if c in (' ', '\t') and not q:
-					if not (i or a):
-						continue
-					if not a:
-						a = i
-						i = ''
-					v = i
-					i = ''
-					attrs.append(Attribute(a, v))
-					a = ''
-					v = ''
-					continue
-				i += c
+		return [Attribute(a, v) for a, v in _attributes(s)]
 
-		if i and not a:
-			a = i
-			i =''
-		if a:
-			v = i
-			attrs.append(Attribute(a, v))
-		return attrs
 
+# attribute name, optionally followed by a value.  Like in the shell a value
+# consists of double quoted, single quoted and unquoted parts that are joined,
+# the quotes of one kind may contain the other one: a="x's" gives x's and
+# a=1"2" gives 12.  Quotes may be left open while typing, stray quotes are
+# skipped.
+ATTRIBUTES = re.compile(r'''
+	([^\s="']+)
+	(?:=((?:"[^"]*"?|'[^']*'?|[^\s"']+)*))?
+	''', re.X)
+VALUE = re.compile(r'''"([^"]*)"?|'([^']*)'?|([^\s"']+)''')
 
-class Tag():
+
+@functools.lru_cache(maxsize=256)
+def _attributes(s):
 	"""
-	Representation of a single XML/HTML tag
+	Scan string into a tuple of (name, value) pairs.  Results are cached,
+	multiplied tags and live typing parse the same string again and again.
 	"""
-	def __init__(self, name):
+	res = []
+	for a, v in ATTRIBUTES.findall(s):
+		if '"' in v or "'" in v:
+			v = ''.join([dq + sq + u for dq, sq, u in VALUE.findall(v)])
+		res.append((a, v))
+	return tuple(res)
+
+
+class Node():
+	"""
+	Common base of tags and groups of tags.  A multiplied node isn't copied,
+	it's a template for all of its copies that are rendered one after the
+	other with their position substituted for $.
+	"""
+	__slots__ = ('parent', 'text', 'profile', 'children', 'name', 'self_closing',
+			'inline', 'attributes', 'mul_end', 'mul_dup', 'mul_rep')
+
+	def __init__(self, name, profile):
 		self.parent = None
 		self.text = None
-		# children could also be operations, grouping is evil
+		self.profile = profile
 		self.children = []
-
-		self.name = ABBREVIATIONS[name] if name in ABBREVIATIONS else name
-		self.self_closing = self.name in SELF_CLOSING_TAGS
-		self.inline = self.name in INLINE_TAGS
-		# children could include operations
-		self.attributes = []
-		self.mul_pos = 1
+		self.name = name
+		self.self_closing = False
+		self.inline = False
+		# attributes by name, dicts preserve the order they were added in
+		self.attributes = {}
+		# number of numbered copies
 		self.mul_end = 1
-
-		# attach default tags
-		for k, v in DEFAULT_ATTRIBUTES.get(self.name, {}).items():
-			self + Attribute(k, v)
+		# number of unnumbered copies, see Parser._attach
+		self.mul_dup = 1
+		# number of copies of every numbered copy, see setmul
+		self.mul_rep = 1
 
 	def __add__(self, a):
 		if isinstance(a, Text):
@@ -249,10 +279,11 @@ class Tag():
 			if not isinstance(a, list):
 				a = [a]
 			for e in a:
-				if e not in self.attributes:
-					self.attributes.append(e)
+				x = self.attributes.get(e.name)
+				if x is None:
+					self.attributes[e.name] = e
 				else:
-					self.attributes[self.attributes.index(e)] + e
+					x + e
 		return self
 
 	def __gt__(self, t):
@@ -260,108 +291,77 @@ class Tag():
 		self.children.append(t)
 		return t
 
-	def __lt__(self, t):
-		self.children.remove(t)
-		return t
-
-	def clone(self, mul=1):
-		t = self.__class__(self.name)
-		t.children = [c.clone() for c in self.children]
-		t.attributes = [a.clone() for a in self.attributes]
-		t.parent = self.parent
-		if self.text:
-			t.text = self.text.clone()
-		t.setmul(mul, end=self.mul_end)
-		return t
-
-	def setmul(self, pos=1, end=1):
-		self.mul_pos = pos
+	def setmul(self, end=1):
+		# multiplying a multiplied tag once more repeats each of its copies,
+		# they are numbered by the last multiplication: a$*3*2 gives a1, a1,
+		# a1, a2, a2, a2
+		self.mul_rep *= self.mul_end
 		self.mul_end = end
 		return self
 
-	def tostr(self, jm, level=0, mul=1):
-		_mul = self.mul_end * (mul - 1) + self.mul_pos if STACKED_MULTIPLICATION else self.mul_pos
-		attrs = (' ' if self.attributes else '') + ' '.join(map(lambda a: a.tostr(jm, mul=_mul), self.attributes))
-		b = '\n'
-		if self.inline or not self.children:
-			b = ''
-		
-		template = '<%(name)s%(attributes)s>%(text)s%(block)s%(children)s%(blockindent)s</%(name)s>'
-		if self.self_closing and not (self.children or self.text):
-			 template = '<%(name)s%(attributes)s />'
-		elif self.inline:
-			template = '<%(name)s%(attributes)s>%(text)s%(children)s</%(name)s>'
-		template = ('' if self.parent and self.parent.inline else '%(indent)s') + template
-
-		return template % {
-				'name': self.name,
-				'text': self.text.tostr(jm, mul=_mul) if self.text else '' if not jm.count or self.children else '$%d' % jm.inc,
-				'indent': '\t' * level,
-				'block': b,
-				'blockindent': '\n' + ('\t' * level) if self.children else '',
-				'children': b.join(map(lambda t: t.tostr(jm, level=level + 1, mul=_mul), self.children)),
-				'attributes': attrs,
-				}
+	def snapshot(self):
+		return (self.parent, self.text, self.children[:], self.mul_end,
+				self.mul_dup, self.mul_rep, [(a, a.value[:]) for a in self.attributes.values()])
+
+	def restore(self, state):
+		self.parent, self.text, children, self.mul_end, self.mul_dup, self.mul_rep, attributes = state
+		self.children = children[:]
+		self.attributes = {}
+		for a, v in attributes:
+			a.value = v[:]
+			self.attributes[a.name] = a
 
 
-class TagList():
+class Tag(Node):
 	"""
-	Wrapper around Tags that might appear in groups if multiplication is used
+	Representation of a single XML/HTML tag
 	"""
-	def __init__(self, objs):
-		if type(objs) in (list, set):
-			self.objs = objs
-		elif issubclass(objs.__class__, self.__class__):
-			self.objs = objs.objs
-		else:
-			self.objs = (objs, )
+	__slots__ = ()
 
-	def __add__(self, a):
-		if isinstance(a, list):
-			return self._iter_objs(lambda obj, a: obj + [e.clone() for e in a], a)
-		return self._iter_objs(lambda obj, a: obj + a.clone(), a)
+	def __init__(self, name, profile):
+		name = profile.abbreviations.get(name, name)
+		Node.__init__(self, name, profile)
+		self.self_closing = name in profile.self_closing_tags
+		self.inline = name in profile.inline_tags
 
-	def __gt__(self, t):
-		return self._iter_objs(lambda obj, t: obj > t.clone(), t)
-
-	def __iter__(self):
-		for obj in self.objs:
-			yield obj
-
-	def __lt__(self, t):
-		# not sure if it makes sense to implement this function
-		pass
-
-	def _iter_objs(self, f, o):
-		res = []
-		for obj in self:
-			res.append(f(obj, o))
-		if len(res) == 1:
-			return res[0]
-		return self.__class__(res)
-
-	def clone(self, mul=1):
-		nobjs = []
-		for obj in self:
-			nobjs += [obj.setmul(end=mul)] + [obj.parent > obj.clone(i) for i in range(2, mul + 1)]
-		self.objs = nobjs
-		return self
+		# attach default tags
+		for k, v in profile.default_attributes.get(name, {}).items():
+			self + Attribute(k, v)
 
-	@property
-	def parent(self):
-		return self.__class__(set([obj.parent for obj in self]))
 
+class Group(Node):
+	"""
+	Group of tags, (...).  The group itself isn't part of the output, its
+	children are rendered once per copy of the group.  Multiplying a group
+	doesn't copy its children, all copies share the same subtree.
+	"""
+	__slots__ = ()
+
+	def __init__(self, profile):
+		Node.__init__(self, None, profile)
 
-STACKED_MULTIPLICATION = False
+	def __add__(self, a):
+		# the group isn't rendered, its attributes and text would be lost
+		raise ValueError('a group has neither attributes nor text')
+
+
+def _tag(s, profile):
+	"""
+	New tag named s, groups are passed through
+	"""
+	return s if isinstance(s, Group) else Tag(s, profile)
 
 
 class Emmet():
 	"""
 	Base class for stacking emmet syntax elements and turing them into text
 	"""
-	def __init__(self):
+	__slots__ = ('children', 'inline', 'profile')
+
+	def __init__(self, profile):
 		self.children = []
 		self.inline = False
+		self.profile = profile
 
 	def __gt__(self, o):
 		o.parent = self
@@ -371,11 +371,15 @@ class Emmet():
 	def __str__(self):
 		return self.tostr(Jumpcount())
 
+	def snapshot(self):
+		return self.children[:]
+
+	def restore(self, state):
+		self.children = state[:]
+
 	def tostr(self, jm):
-		global STACKED_MULTIPLICATION
-		import vim
-		STACKED_MULTIPLICATION = int(vim.vars.get('emmet_stacked_multiplication', 0))
-		return '\n'.join([t.tostr(jm) for t in self.children])
+		i = 2 if jm.count else 1
+		return '\n'.join(['\t' * l[0] + l[i] for l in render(self, jm)])
 
 
 class Jumpcount():
@@ -383,10 +387,13 @@ class Jumpcount():
 	Object for counting jumps figuring out the current jump id in order to
 	implement dynamic jumps.  Jumps have to be represent by $N which doesn't
 	look good in the preview.  Therefore, the output of the write function
-	doesn't include jump ids.  They are added later on by the post_jump function
-	that passes the resulting string to snip.expand_anon which will remove the
-	jump ids before showing the results to the user.
+	doesn't include jump ids.  The text including jump ids is rendered in the
+	same pass and later on used by the post_jump function that passes it to
+	snip.expand_anon which will remove the jump ids before showing the results
+	to the user.
 	"""
+	__slots__ = ('c', 'count')
+
 	def __init__(self, count=False):
 		self.c = 1
 		self.count = count
@@ -397,88 +404,1521 @@ class Jumpcount():
 		return self.c
 
 
-# global variable to transport Emmet object to post_jump function
-E = None
-FT = None
-DEFAULT_ATTRIBUTES = {}
-INLINE_TAGS = []
-SELF_CLOSING_TAGS = []
-ABBREVIATIONS = []
+# shipped configuration of the file types, g:emmet_FILETYPE_* variables
+# replace and g:emmet_FILETYPE_*_extension variables extend it
+PROFILES = {
+		'html': {
+			'default_attributes': {
+				'a': {'href': ''},
+				'abbr': {'title': ''},
+				'audio': {'src': ''},
+				'button': {'type': ''},
+				'form': {'action': '', 'method': ''},
+				'iframe': {'src': ''},
+				'img': {'src': '', 'alt': ''},
+				'input': {'id': '', 'name': '', 'type': ''},
+				'link': {'rel': 'stylesheet', 'href': '', 'type': 'text/css'},
+				'option': {'value': ''},
+				'script': {'src': ''},
+				'select': {'name': '', 'id': ''},
+				'textarea': {'name': '', 'id': ''},
+				'video': {'src': ''},
+				},
+			'inline_tags': [
+				'a', 'abbr', 'area', 'b', 'base', 'blockquote', 'br', 'button',
+				'cite', 'data', 'dd', 'dfn', 'dt', 'em', 'embed', 'font', 'hr', 'i',
+				'img', 'input', 'keygen', 'link', 'map', 'meta', 'object', 'param',
+				'q', 's', 'small', 'source', 'span', 'strike', 'strong', 'sub',
+				'sup', 'time', 'track', 'u', 'li', 'var', 'wbr',
+				],
+			'self_closing_tags': [
+				'area', 'base', 'br', 'embed', 'hr', 'img', 'input', 'keygen',
+				'link', 'meta', 'param', 'source', 'track', 'wbr',
+				],
+			'abbreviations': {
+				'bq': 'blockquote', 'fig': 'figure', 'figc': 'figcaption',
+				'pic': 'picture', 'ifr': 'iframe', 'emb': 'embed', 'obj': 'object',
+				'cap': 'caption', 'colg': 'colgroup', 'fst': 'fieldset',
+				'btn': 'button', 'optg': 'optgroup', 'tarea': 'textarea',
+				'leg': 'legend', 'sect': 'section', 'art': 'article',
+				'hdr': 'header', 'ftr': 'footer', 'adr': 'address', 'dlg': 'dialog',
+				'str': 'strong', 'prog': 'progress', 'mn': 'main', 'tem': 'template',
+				'fset': 'fieldset', 'datag': 'datagrid', 'datal': 'datalist',
+				'kg': 'keygen', 'out': 'output', 'det': 'details', 'cmd': 'command',
+				},
+			},
+		'xml': {},
+		'xsl': {},
+		'xslt': {},
+		'docbk': {},
+		}
+
+
+# configuration variables of a file type, g:emmet_FILETYPE_*
+CONFIG = ('default_attributes', 'inline_tags', 'self_closing_tags', 'abbreviations')
+
+
+def _plain(v):
+	"""
+	Convert a value of vim.vars into plain Python objects, strings are bytes
+	in vim's python3 interface
+	"""
+	if isinstance(v, bytes):
+		return v.decode('utf-8')
+	if isinstance(v, (str, int, float)):
+		return v
+	if hasattr(v, 'items'):
+		return dict((_plain(k), _plain(x)) for k, x in v.items())
+	return [_plain(x) for x in v]
 
 
-def _setup(ft):
+def _merge(ft, get):
+	"""
+	Shipped configuration of the file type where get(KEY) replaces and
+	get(KEY_extension) extends a value, get returns None for unset keys
+	"""
+	defaults = PROFILES.get(ft, {})
+	d = {}
+	for k in CONFIG:
+		v = get(k)
+		v = defaults.get(k, {}) if v is None else v
+		# older versions of the ftplugins read the plural for abbreviations
+		ext = get(k + '_extension')
+		if ext is None:
+			ext = get(k + '_extensions')
+		if ext is not None:
+			if isinstance(ext, dict):
+				v = dict(v)
+				v.update(ext)
+			else:
+				v = list(v) + list(ext)
+		d[k] = v
+	return d
+
+
+class Profile(collections.namedtuple('Profile', (
+		'ft', 'default_attributes', 'inline_tags', 'self_closing_tags',
+		'abbreviations', 'stacked_multiplication', 'version'))):
+	"""
+	Immutable snapshot of the configuration of a file type.  Tag classes are
+	stored as frozensets, abbreviations and default attributes as plain dicts.
+	"""
+	__slots__ = ()
+
+	@classmethod
+	def from_vim(cls, ft, version=None):
+		"""
+		Merge the shipped configuration of the file type with the
+		g:emmet_FILETYPE_* and g:emmet_FILETYPE_*_extension variables
+		"""
+		import vim
+		if version is None:
+			version = _version(ft)
+		def get(name):
+			v = vim.vars.get('emmet_%s_%s' % (ft, name))
+			return None if v is None else _plain(v)
+		d = _merge(ft, get)
+		d['stacked_multiplication'] = version[1]
+		return cls.from_dict(ft, d)._replace(version=version)
+
+	@classmethod
+	def from_filetype(cls, ft, d=None):
+		"""
+		Merge the shipped configuration of the file type with a plain dict
+		that uses the same keys as from_dict and the *_extension keys of the
+		g:emmet_FILETYPE_* variables
+		"""
+		d = d or {}
+		merged = _merge(ft, d.get)
+		merged['stacked_multiplication'] = d.get('stacked_multiplication', 0)
+		return cls.from_dict(ft, merged)
+
+	@classmethod
+	def from_dict(cls, ft, d):
+		"""
+		Create profile from a plain dict, e.g. loaded from a JSON file, that
+		uses the names of the g:emmet_FILETYPE_* variables without prefix:
+		default_attributes, inline_tags, self_closing_tags, abbreviations and
+		stacked_multiplication
+		"""
+		stacked = int(d.get('stacked_multiplication', 0))
+		return cls(
+				ft,
+				dict((k, dict(v)) for k, v in d.get('default_attributes', {}).items()),
+				frozenset(d.get('inline_tags', [])),
+				frozenset(d.get('self_closing_tags', [])),
+				dict(d.get('abbreviations', {})),
+				bool(stacked),
+				(0, stacked),
+				)
+
+	def to_dict(self):
+		"""
+		Plain dict of the configuration as accepted by from_dict
+		"""
+		return {
+				'default_attributes': self.default_attributes,
+				'inline_tags': sorted(self.inline_tags),
+				'self_closing_tags': sorted(self.self_closing_tags),
+				'abbreviations': self.abbreviations,
+				'stacked_multiplication': int(self.stacked_multiplication),
+				}
+
+	def digest(self):
+		"""
+		Hash of the configuration, unlike version it stays the same across vim
+		sessions
+		"""
+		import hashlib
+		import json
+		data = json.dumps([self.default_attributes, sorted(self.inline_tags),
+			sorted(self.self_closing_tags), self.abbreviations,
+			self.stacked_multiplication])
+		return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def _copies(obj):
+	"""
+	Iterate over all copies of obj's children, yields (tag, position) tuples
+	"""
+	for t in obj.children:
+		for _ in range(t.mul_dup):
+			for pos in range(1, t.mul_end + 1):
+				for _ in range(t.mul_rep):
+					yield t, pos
+
+
+# instructions of the renderer: append text, start a new line, render children
+R_TEXT     = 0
+R_LINE     = 1
+R_CHILDREN = 2
+
+
+def render(e, jm):
+	"""
+	Render the Emmet object line by line.  The tree is walked with an explicit
+	stack instead of recursion and lines are yielded as soon as they are
+	complete.  Every line is rendered twice in the same pass, as preview and
+	including jump ids, the result are (level, line, line with jumps) tuples.
+	"""
+	level = 0
+	line = []
+	jline = []
+	# the first tag doesn't start with an empty line, empty groups and tags
+	# without copies don't count as first tag
+	started = False
+	# children: copies, level, mul, number of copies, newline before next copy,
+	# block parent, children of a group
+	stack = [(R_CHILDREN, _copies(e), 0, 1, 1, True, True, False)]
+	while stack:
+		op = stack.pop()
+		if op[0] == R_TEXT:
+			line.append(op[1])
+			jline.append(op[1])
+			continue
+		if op[0] == R_LINE:
+			yield level, ''.join(line), ''.join(jline)
+			level = op[1]
+			line = []
+			jline = []
+			continue
+
+		_, copies, lvl, mul, total, newline, block, grouped = op
+		t, pos = next(copies, (None, None))
+		if t is None:
+			continue
+		stack.append((R_CHILDREN, copies, lvl, mul, total, block, block, grouped))
+		# the numbering of a group's children continues across its copies
+		if grouped or t.profile.stacked_multiplication:
+			_mul = t.mul_end * (mul - 1) + pos
+			_total = t.mul_end * total
+		else:
+			_mul = pos
+			_total = t.mul_end
+		if isinstance(t, Group):
+			stack.append((R_CHILDREN, _copies(t), lvl, _mul, _total, newline, block, True))
+			continue
+		if newline:
+			if started or line:
+				yield level, ''.join(line), ''.join(jline)
+			level = lvl
+			line = []
+			jline = []
+		started = True
+
+		attrs = [a.tostr(jm, _mul, _total) for a in t.attributes.values()]
+		attr = ''.join([' ' + a for a, _ in attrs])
+		jattr = ''.join([' ' + ja for _, ja in attrs])
+		if t.text:
+			text, jtext = t.text.tostr(jm, _mul, _total)
+		else:
+			text, jtext = '', '' if t.children else '$%d' % jm.inc
+		if t.self_closing and not (t.children or t.text):
+			line.append('<%s%s />' % (t.name, attr))
+			jline.append('<%s%s />' % (t.name, jattr))
+		elif not t.children:
+			line.append('<%s%s>%s</%s>' % (t.name, attr, text, t.name))
+			jline.append('<%s%s>%s</%s>' % (t.name, jattr, jtext, t.name))
+		else:
+			line.append('<%s%s>%s' % (t.name, attr, text))
+			jline.append('<%s%s>%s' % (t.name, jattr, jtext))
+			stack.append((R_TEXT, '</%s>' % t.name))
+			if not t.inline:
+				stack.append((R_LINE, lvl))
+			stack.append((R_CHILDREN, _copies(t), lvl + 1, _mul, _total, not t.inline, not t.inline, False))
+	yield level, ''.join(line), ''.join(jline)
+
+
+# instructions of templates besides static strings
+OP_VALUE = 0  # numbered value, it's a jump as well
+OP_CLASS = 1  # numbered values separated by spaces
+OP_JUMP  = 2  # jump without value
+OP_SKIP  = 3  # jump id that's not part of the output
+OP_LINE  = 4  # start a new line at the given level
+OP_LOOP  = 5  # copies of a tag: copies, numbered copies, index of the first
+              # instruction after the loop, stacked numbering, repetitions
+              # of every numbered copy
+OP_NEXT  = 6  # end of a copy, index of the first instruction of the copy
+OP_GROUP = 7  # copies of a group, the same as OP_LOOP
+
+TEMPLATE_VERSION = 4
+
+
+def _value(v):
+	return v if v.__class__ is str else tuple(v)
+
+
+class Template():
+	"""
+	Compiled form of an Emmet object: static string fragments interleaved
+	with instructions for numbered values, jump ids, line breaks and loops for
+	the copies of multiplied tags and groups.  Rendering a template needs
+	neither the tag objects nor the profile.
+	"""
+	__slots__ = ('ops', )
+
+	def __init__(self, ops):
+		self.ops = ops
+
+	@classmethod
+	def compile(cls, e):
+		"""
+		Compile the Emmet object into a template
+		"""
+		ops = []
+
+		def emit(op):
+			if op.__class__ is str and ops and ops[-1].__class__ is str:
+				ops[-1] += op
+			else:
+				ops.append(op)
+
+		stacked = e.profile.stacked_multiplication
+		# tag, level, newline before every copy, child of a group, index of the
+		# loop instruction for closing a tag with children
+		stack = [(t, 0, True, False, None) for t in reversed(e.children)]
+		while stack:
+			t, lvl, newline, grouped, loop = stack.pop()
+			if loop is None:
+				loop = len(ops)
+				ops.append(None)
+				if isinstance(t, Group):
+					stack.append((t, lvl, newline, grouped, loop))
+					stack.extend([(c, lvl, newline, True, None) for c in reversed(t.children)])
+					continue
+				if newline:
+					emit((OP_LINE, lvl))
+				emit('<' + t.name)
+				for a in t.attributes.values():
+					emit(' %s="' % a.name)
+					emit((OP_CLASS if a.value.__class__ is list else OP_VALUE, a.value))
+					emit('"')
+				if t.self_closing and not (t.children or t.text):
+					emit((OP_SKIP, ))
+					emit(' />')
+				elif not t.children:
+					emit('>')
+					emit((OP_VALUE, t.text.value) if t.text else (OP_JUMP, ))
+					emit('</%s>' % t.name)
+				else:
+					emit('>')
+					if t.text:
+						emit((OP_VALUE, t.text.value))
+					stack.append((t, lvl, newline, grouped, loop))
+					stack.extend([(c, lvl + 1, not t.inline, False, None) for c in reversed(t.children)])
+					continue
+			elif not isinstance(t, Group):
+				if not t.inline:
+					emit((OP_LINE, lvl))
+				emit('</%s>' % t.name)
+			ops.append((OP_NEXT, loop + 1))
+			ops[loop] = (OP_GROUP if isinstance(t, Group) else OP_LOOP,
+					t.mul_dup, t.mul_end, len(ops), stacked or grouped, t.mul_rep)
+		return cls(ops)
+
+	def elements(self):
+		"""
+		Number of elements in the output
+		"""
+		res = 0
+		copies = [1]
+		for op in self.ops:
+			if op.__class__ is str:
+				continue
+			if op[0] == OP_LOOP or op[0] == OP_GROUP:
+				n = copies[-1] * op[1] * op[2] * op[5]
+				if op[0] == OP_LOOP:
+					res += n
+				copies.append(n)
+			elif op[0] == OP_NEXT:
+				copies.pop()
+		return res
+
+	def render(self, limit=0):
+		"""
+		Render the template line by line, the result are the same (level,
+		line, line with jumps) tuples as the ones of the render function.  If
+		limit is set, rendering stops after limit lines with a line that
+		summarizes the number of elements that were left out.  This line
+		doesn't have a version with jumps.
+		"""
+		ops = self.ops
+		c = 1
+		mul = 1
+		total = 1
+		level = 0
+		line = []
+		jline = []
+		# the first tag doesn't start with an empty line
+		started = False
+		lines = 0
+		elements = 0
+		# loops: first instruction, copies done, copies, mul_end, outer mul,
+		# stacked numbering, loop of a tag, outer number of copies, mul_rep
+		loops = []
+		pc = 0
+		n = len(ops)
+		while pc < n:
+			op = ops[pc]
+			pc += 1
+			if op.__class__ is str:
+				line.append(op)
+				jline.append(op)
+				continue
+			code = op[0]
+			if code == OP_VALUE or code == OP_CLASS:
+				if code == OP_VALUE:
+					nv = _number(op[1], mul, total)
+				else:
+					nv = ' '.join([v for v in [_number(v, mul, total) for v in op[1]] if v])
+				c += 1
+				line.append(nv)
+				jline.append('${%d:%s}' % (c, nv) if nv else '$%d' % c)
+			elif code == OP_JUMP:
+				c += 1
+				jline.append('$%d' % c)
+			elif code == OP_SKIP:
+				c += 1
+			elif code == OP_LINE:
+				if started or line:
+					yield level, ''.join(line), ''.join(jline)
+					line = []
+					jline = []
+					lines += 1
+					if limit and lines >= limit:
+						# the element that starts on this line isn't shown
+						left = self.elements() - elements
+						if loops and loops[-1][0] == pc - 1:
+							left += 1
+						if left:
+							yield op[1], '… {:,} more element{}'.format(left, 's' if left > 1 else ''), None
+							return
+				started = True
+				level = op[1]
+			elif code == OP_LOOP or code == OP_GROUP:
+				copies = op[1] * op[2] * op[5]
+				if not copies:
+					pc = op[3]
+					continue
+				if code == OP_LOOP:
+					elements += 1
+				loops.append([pc, 1, copies, op[2], mul, op[4], code == OP_LOOP, total, op[5]])
+				if op[4]:
+					mul = op[2] * (mul - 1) + 1
+					total = op[2] * total
+				else:
+					mul = 1
+					total = op[2]
+			else:
+				loop = loops[-1]
+				if loop[1] < loop[2]:
+					pos = loop[1] // loop[8] % loop[3] + 1
+					loop[1] += 1
+					if loop[6]:
+						elements += 1
+					mul = loop[3] * (loop[4] - 1) + pos if loop[5] else pos
+					pc = loop[0]
+				else:
+					loops.pop()
+					mul = loop[4]
+					total = loop[7]
+		yield level, ''.join(line), ''.join(jline)
+
+	def to_json(self):
+		return {'ops': self.ops}
+
+	@classmethod
+	def from_json(cls, d):
+		ops = []
+		for op in d['ops']:
+			if op.__class__ is str:
+				ops.append(op)
+			elif op[0] == OP_VALUE:
+				ops.append((OP_VALUE, _value(op[1])))
+			elif op[0] == OP_CLASS:
+				ops.append((OP_CLASS, [_value(v) for v in op[1]]))
+			else:
+				ops.append(tuple(op))
+		return cls(ops)
+
+
+class TemplateStore():
+	"""
+	Templates of expanded abbreviations kept in a file across vim sessions,
+	see g:emmet_template_cache.  Templates are stored per digest of the
+	profile they were compiled with.
+
+	The file is a log with one line of JSON per saved template after a
+	header line.  Saving a template appends a line in a background thread,
+	the last line of an abbreviation wins.  Only the size most recently used
+	templates are kept: the log is compacted once it has more than twice as
+	many lines.  Several vim instances can share the file, an entry that's
+	appended by another instance while the log is compacted might get lost.
+	"""
+	def __init__(self, path, size=1000):
+		self.path = path
+		self.size = size
+		self.lock = threading.Lock()
+		# (digest, abbreviation): template as JSON, oldest first
+		self._entries = None
+		self._digests = {}
+		self._queue = None
+		# number of lines in the file, only used by the writer thread
+		self._lines = None
+
+	def _read(self):
+		"""
+		Entries of the file in the order they were saved and the number of
+		lines, None if the file doesn't exist or has another version
+		"""
+		import json
+		entries = collections.OrderedDict()
+		lines = 0
+		try:
+			with open(self.path) as f:
+				header = json.loads(f.readline())
+				if header.get('version') != TEMPLATE_VERSION or 'profiles' in header:
+					return None, 0
+				for line in f:
+					lines += 1
+					try:
+						d = json.loads(line)
+						key = (d['p'], d['a'])
+						entries.pop(key, None)
+						entries[key] = d['t']
+					except (ValueError, KeyError, TypeError):
+						pass
+		except (IOError, OSError, ValueError, AttributeError):
+			return None, 0
+		while len(entries) > self.size:
+			entries.popitem(last=False)
+		return entries, lines
+
+	def _digest(self, profile):
+		d = self._digests.get(profile.ft)
+		if d is None or d[0] is not profile:
+			d = self._digests[profile.ft] = (profile, profile.digest())
+		return d[1]
+
+	def get(self, emmet, profile):
+		with self.lock:
+			if self._entries is None:
+				self._entries = self._read()[0] or collections.OrderedDict()
+			d = self._entries.get((self._digest(profile), emmet))
+		return Template.from_json(d) if d else None
+
+	def save(self, emmet, profile, template):
+		"""
+		Remember template as the most recently used one and append it to the
+		file in the background
+		"""
+		import json
+		key = (self._digest(profile), emmet)
+		t = template.to_json()
+		with self.lock:
+			if self._entries is None:
+				self._entries = self._read()[0] or collections.OrderedDict()
+			self._entries.pop(key, None)
+			self._entries[key] = t
+			if len(self._entries) > self.size:
+				self._entries.popitem(last=False)
+			if self._queue is None:
+				import queue
+				self._queue = queue.Queue()
+				thread = threading.Thread(target=self._write, name='emmet-store')
+				thread.daemon = True
+				thread.start()
+		self._queue.put(json.dumps({'p': key[0], 'a': emmet, 't': t}) + '\n')
+
+	def flush(self):
+		"""
+		Wait until all saved templates are written
+		"""
+		if self._queue is not None:
+			self._queue.join()
+
+	def _write(self):
+		"""
+		Writer thread, appends lines to the file and compacts it
+		"""
+		while True:
+			line = self._queue.get()
+			try:
+				if self._lines is None:
+					entries, self._lines = self._read()
+					if entries is None:
+						self._rewrite([])
+				with open(self.path, 'a') as f:
+					f.write(line)
+				self._lines += 1
+				if self._lines > 2 * self.size:
+					self._compact()
+			except (IOError, OSError):
+				# try again with the next template
+				self._lines = None
+			finally:
+				self._queue.task_done()
+
+	def _compact(self):
+		import json
+		entries, _ = self._read()
+		self._rewrite([json.dumps({'p': k[0], 'a': k[1], 't': t}) + '\n'
+			for k, t in (entries or {}).items()])
+
+	def _rewrite(self, lines):
+		import json
+		tmp = '%s.%d' % (self.path, os.getpid())
+		with open(tmp, 'w') as f:
+			f.write(json.dumps({'version': TEMPLATE_VERSION}) + '\n')
+			f.writelines(lines)
+		os.replace(tmp, self.path)
+		self._lines = len(lines)
+
+
+class Cancelled(Exception):
+	"""
+	Raised in the worker thread when its job is superseded by a newer one
+	"""
+
+
+def _cancellable(lines, cancelled):
+	"""
+	Pass lines through, every 256 lines it's checked whether the job was
+	cancelled
+	"""
+	for i, l in enumerate(lines):
+		if not i & 255 and cancelled():
+			raise Cancelled()
+		yield l
+
+
+class Expansion():
+	"""
+	Result of parsing an abbreviation: its preview lines and the text including
+	jump ids that's used by the post_jump function.  Both are rendered right
+	away in a single pass because the Emmet object is reused by the Parser for
+	the next keystroke.  emmet is either an Emmet object or a Template.
+
+	The preview of a template can be limited to a number of lines, the text
+	for post_jump is then rendered in full when it's requested.
+	"""
+	def __init__(self, emmet, limit=0, cancelled=None):
+		if isinstance(emmet, Template):
+			self.template = emmet
+			lines = emmet.render(limit)
+			self.lines = list(_cancellable(lines, cancelled) if cancelled else lines)
+			self.truncated = self.lines[-1][2] is None
+		else:
+			self.template = None
+			self.lines = list(render(emmet, Jumpcount(True)))
+			self.truncated = False
+		# abbreviation and profile, set by the write function
+		self.source = None
+		self._jumps = None
+
+	@property
+	def preview(self):
+		return [l[:2] for l in self.lines]
+
+	@property
+	def jumps(self):
+		if self._jumps is None:
+			lines = self.template.render() if self.truncated else self.lines
+			self._jumps = '\n'.join(['\t' * l[0] + l[2] for l in lines])
+		return self._jumps
+
+
+class ExpansionCache():
+	"""
+	Bounded LRU cache of expansions.  The write function is called on every
+	keystroke, backspacing and retyping an abbreviation therefore leads to the
+	same expansion being requested over and over again.
+	"""
+	def __init__(self, size=64):
+		self.size = size
+		self.hits = 0
+		self.misses = 0
+		self._entries = collections.OrderedDict()
+		# expansions are added by the worker thread as well
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def get(self, key):
+		with self._lock:
+			x = self._entries.get(key)
+			if x is None:
+				self.misses += 1
+			else:
+				self.hits += 1
+				self._entries.move_to_end(key)
+			return x
+
+	def put(self, key, x):
+		with self._lock:
+			self._entries[key] = x
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.size:
+				self._entries.popitem(last=False)
+			return x
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self.hits = 0
+			self.misses = 0
+
+	@property
+	def stats(self):
+		return {
+				'hits': self.hits,
+				'misses': self.misses,
+				'entries': len(self._entries),
+				'size': self.size,
+				}
+
+
+def _length(value, digits):
+	"""
+	Approximate length of a compiled value, counters are assumed to have the
+	given number of digits
+	"""
+	if value.__class__ is list:
+		return sum([_length(v, digits) + 1 for v in value])
+	if value.__class__ is str:
+		return len(value)
+	return sum([len(v) if v.__class__ is str else
+		max(v, digits) if v.__class__ is int else max(v[0], digits, len(str(v[2])))
+		for v in value])
+
+
+def _size(e):
+	"""
+	Size of the output of the Emmet object without rendering it: number of
+	tags, elements and attributes and the approximate number of characters
+	"""
+	res = {'tags': 0, 'elements': 0, 'attributes': 0, 'bytes': 0}
+	stack = [(e, 1, 0)]
+	while stack:
+		obj, copies, level = stack.pop()
+		for t in obj.children:
+			n = copies * t.mul_dup * t.mul_end * t.mul_rep
+			if isinstance(t, Group):
+				stack.append((t, n, level))
+				continue
+			digits = len(str(n))
+			# indentation, new line, opening and closing tag
+			b = level + 1 + len(t.name) * 2 + 5
+			if t.children and not t.inline:
+				# closing tag on its own line
+				b += level + 1
+			for a in t.attributes.values():
+				b += len(a.name) + 4 + _length(a.value, digits)
+			if t.text:
+				b += _length(t.text.value, digits)
+			res['tags'] += 1
+			res['elements'] += n
+			res['attributes'] += n * len(t.attributes)
+			res['bytes'] += n * b
+			stack.append((t, n, level + 1))
+	return res
+
+
+class ExpansionTooLarge(ValueError):
+	"""
+	Raised if an expansion exceeds the maximum number of elements
+	"""
+	def __init__(self, elements, limit):
+		ValueError.__init__(self, 'Expansion too large: {:,} elements, the limit is {:,}'.format(elements, limit))
+		self.elements = elements
+		self.limit = limit
+
+
+def _guard(elements, limit):
+	if limit and elements > limit:
+		raise ExpansionTooLarge(elements, limit)
+
+
+class Timing():
+	"""
+	Wall time of the phases of a single call of write or post_jump together
+	with the size of the expansion.  Timing is enabled by g:emmet_profile,
+	finished records are kept in the ring buffer TIMINGS and appended to the
+	file g:emmet_profile_log if it's set.
+	"""
+	def __init__(self, function, emmet, enabled=True):
+		self.enabled = enabled
+		if enabled:
+			self.record = {'function': function, 'emmet': emmet,
+					'time': time.time(), 'phases': []}
+			self._start = self._t = time.perf_counter()
+
+	def __call__(self, phase):
+		if self.enabled:
+			t = time.perf_counter()
+			self.record['phases'].append((phase, t - self._t))
+			self._t = t
+
+	def set(self, **kwargs):
+		if self.enabled:
+			self.record.update(kwargs)
+
+	def count(self, size):
+		# size is the result of _size
+		if self.enabled:
+			self.record['tags'], self.record['elements'] = size['tags'], size['elements']
+
+	def done(self, log=None):
+		if not self.enabled:
+			return
+		self.record['total'] = time.perf_counter() - self._start
+		TIMINGS.append(self.record)
+		if log:
+			import json
+			with open(log, 'a') as f:
+				f.write(json.dumps(self.record) + '\n')
+
+
+# recorded timings of all sessions
+TIMINGS = collections.deque(maxlen=100)
+
+
+@functools.lru_cache(maxsize=32)
+def _variables(ft):
+	"""
+	Vim expression of the values of the configuration variables of the file
+	type, 0 for variables that aren't set
+	"""
+	return 'string([%s])' % ', '.join(["get(g:, 'emmet_%s_%s%s', 0)" % (ft, k, suffix)
+		for k in CONFIG for suffix in ('', '_extension', '_extensions')])
+
+
+def _version(ft):
+	"""
+	Fingerprint of the configuration of the file type, changes of the
+	g:emmet_FILETYPE_* variables take effect right away.  Usually none of
+	them is set and the check is cheap.
+	"""
+	import vim
+	return (hash(vim.eval(_variables(ft))),
+			int(vim.vars.get('emmet_stacked_multiplication', 0)))
+
+
+def _limit():
+	import vim
+	return int(vim.vars.get('emmet_preview_limit', 1000))
+
+
+def _max_elements():
+	import vim
+	return int(vim.vars.get('emmet_max_elements', 200000))
+
+
+def _background():
+	"""
+	Deadline in milliseconds for expanding in the background, 0 if it's
+	disabled
+	"""
 	import vim
-	global FT, DEFAULT_ATTRIBUTES, INLINE_TAGS, SELF_CLOSING_TAGS, ABBREVIATIONS
-	FT = ft
-	DEFAULT_ATTRIBUTES = vim.vars.get('emmet_%s_default_attributes' % FT, {})
-	INLINE_TAGS = vim.vars.get('emmet_%s_inline_tags' % FT, [])
-	SELF_CLOSING_TAGS = vim.vars.get('emmet_%s_self_closing_tags' % FT, [])
-	ABBREVIATIONS = vim.vars.get('emmet_%s_abbreviations' % FT, {})
+	return int(vim.vars.get('emmet_background', 0))
+
+
+def _server():
+	"""
+	Path of the socket of the expansion server, None if it's not used
+	"""
+	import vim
+	path = vim.vars.get('emmet_server')
+	if not path:
+		return None
+	return os.path.expanduser(path.decode() if isinstance(path, bytes) else path)
+
+
+def _timing(function, emmet):
+	import vim
+	return Timing(function, emmet, bool(int(vim.vars.get('emmet_profile', 0))))
+
+
+def _log():
+	import vim
+	log = vim.vars.get('emmet_profile_log')
+	return log.decode() if isinstance(log, bytes) else log
+
+
+def profile_dump(path=None):
+	"""
+	Print the recorded timings, e.g. :py3 emmet.profile_dump(), or write them
+	as JSON to path
+	"""
+	if path:
+		import json
+		with open(path, 'w') as f:
+			json.dump(list(TIMINGS), f, indent=1)
+		return
+	for r in TIMINGS:
+		print('%-9s %8.3fms %s %s' % (r['function'], r['total'] * 1000,
+			' '.join(['%s=%.3fms' % (k, v * 1000) for k, v in r['phases']]),
+			' '.join(['%s=%s' % (k, r[k]) for k in ('cached', 'stored', 'tags', 'elements', 'lines', 'truncated') if k in r])))
+		print('          %s' % r['emmet'])
+
+
+# pending relations of the parser, the number of ^ is counted
+REL_CHILD   = '>'
+REL_SIBLING = '+'
+REL_PARENT  = '^'
+
+
+def _path(ct, top):
+	"""
+	Ancestors of ct from top down to ct's parent, empty if ct is top
+	"""
+	res = []
+	while ct is not top:
+		ct = ct.parent
+		res.append(ct)
+	res.reverse()
+	return res
+
+
+class Parser():
+	"""
+	Resumable parser for live typing.  The parser state is checkpointed after
+	every operator token.  Changes of existing objects are recorded in a
+	journal before they are made: the state of a tag that an operator
+	modifies and the parent a tag is attached to.  A checkpoint only keeps
+	the length of the journal.  Appending characters to the abbreviation
+	resumes parsing at the last checkpoint, deleting characters rolls back to
+	an earlier one by undoing the journal entries made after it.  The
+	returned Emmet object is reused by the next call to parse.
+
+	Parsers that are used only once are created with resumable=False, they
+	don't keep checkpoints and a journal.
+
+	The ancestors of the current tag are kept on a stack, >, + and ^ attach
+	new tags directly to the right parent.
+	"""
+	def __init__(self, profile, resumable=True):
+		self.profile = profile
+		self.resumable = resumable
+		self.emmet = ''
+		self.e = Emmet(profile)
+		# objects a tag was attached to and (object, state) tuples of
+		# modified objects
+		self.journal = []
+		# position, current tag object, operation, string, innermost group,
+		# outer groups, length of the journal
+		self.checkpoints = [(0, self.e, None, '', self.e, (), 0)]
+
+	def _apply(self, o, ct, s):
+		"""
+		Apply the operation o to ct
+		"""
+		if self.resumable:
+			self.journal.append((ct, ct.snapshot()))
+		return o(ct, s)
+
+	def _add(self, parent, t):
+		"""
+		Attach t to parent
+		"""
+		if self.resumable:
+			self.journal.append(parent)
+		return parent > t
+
+	def _attach(self, rel, ct, s, parents):
+		"""
+		Attach a new tag named s, or a group, according to the relation
+		(operator, count) to ct and return it.  parents is the ancestor stack
+		of ct and is updated for the new tag.
+		"""
+		op, count = rel
+		t = _tag(s, self.profile)
+		if op == REL_CHILD or not parents:
+			parents.append(ct)
+		elif op == REL_PARENT:
+			for i in range(count):
+				# never climb out of the innermost group
+				if len(parents) < 2:
+					break
+				p = parents.pop()
+				if i:
+					# the tag is attached to every copy of the tags it climbs out of
+					t.mul_dup *= p.mul_dup * p.mul_end * p.mul_rep
+		return self._add(parents[-1], t)
+
+	def parse(self, emmet):
+		checkpoints = self.checkpoints
+		if not emmet.startswith(self.emmet):
+			# roll back to the last checkpoint before the first change
+			old = self.emmet
+			while checkpoints[-1][0] > len(emmet) or \
+					emmet[:checkpoints[-1][0]] != old[:checkpoints[-1][0]]:
+				checkpoints.pop()
+		pos, ct, o, s, top, groups, mark = checkpoints[-1]
+		journal = self.journal
+		while len(journal) > mark:
+			entry = journal.pop()
+			if entry.__class__ is tuple:
+				entry[0].restore(entry[1])
+			else:
+				entry.children.pop()
+		self.emmet = emmet
+		parents = _path(ct, top)
+
+		# top is the Emmet object or the innermost group, the first tag inside
+		# of it doesn't need an operator.  o is a pending operation, either an
+		# entry of operators or a relation.
+		for c, v, end in tokenize(emmet, pos):
+			if c:
+				if s:
+					if o.__class__ is tuple:
+						ct = self._attach(o, ct, s, parents)
+						o = None
+					elif o:
+						ct = self._apply(o, ct, s)
+						o = None
+					elif ct is top:
+						ct = self._add(top, Tag(s, self.profile))
+						parents = [top]
+					s = ''
+
+				if c == REL_PARENT and o and o[0] == REL_PARENT:
+					o = (REL_PARENT, o[1] + 1)
+				elif c in (REL_CHILD, REL_SIBLING, REL_PARENT):
+					o = (c, 1)
+				elif c == O_GROUP:
+					g = Group(self.profile)
+					if o.__class__ is tuple:
+						self._attach(o, ct, g, parents)
+					elif ct is top:
+						self._add(top, g)
+					else:
+						# a group right after a tag is its sibling: a(b) is a+(b)
+						self._attach((REL_SIBLING, 1), ct, g, parents)
+					groups += (top, )
+					ct = top = g
+					parents = []
+					o = None
+				elif c == O_GROUP_END:
+					if groups:
+						# operators following the group apply to the group
+						ct = top
+						top = groups[-1]
+						groups = groups[:-1]
+						parents = _path(ct, top)
+					o = None
+				else:
+					o = operators[c]
+			s += v
+			# text and attributes might still be extended by the next keystroke
+			if c and c not in (O_TEXT, O_C_ATTR) and self.resumable:
+				checkpoints.append((end, ct, o, s, top, groups, len(journal)))
+
+		# fall back, end of string reached
+		if s:
+			if o.__class__ is tuple:
+				self._attach(o, ct, s, parents)
+			elif o:
+				self._apply(o, ct, s)
+			elif ct is top:
+				self._add(top, Tag(s, self.profile))
+		return self.e
 
 
 def parse(emmet, ft):
 	"""
-	Main method to parse the user's input and create an Emmet object structure
-	"""
-	_setup(ft)
-	# base element
-	e = Emmet()
-	# current tag object
-	ct = e
-	# operation
-	o = None
-	o_trigger = None
-	# string that has been read
-	s = ''
-
-	ops_keys = operators.keys()
-
-	for c in emmet:
-		if c not in ops_keys or \
-				(o_trigger == O_TEXT and c != O_TEXT_END) or \
-				(o_trigger == O_C_ATTR and c != O_C_ATTR_END):
-			if c == ' ' and o_trigger not in (O_TEXT, O_C_ATTR):
+	Main method to parse the user's input and create an Emmet object structure.
+	ft is either a file type whose configuration is read from vim or a Profile.
+	"""
+	profile = ft if isinstance(ft, Profile) else _profile(ft)
+	return Parser(profile, resumable=False).parse(emmet)
+
+
+def _dict_profile(profile, ft):
+	"""
+	Profile for the vim-free API: a Profile is used as is, a plain dict is
+	merged with the shipped configuration of ft as in Profile.from_filetype
+	"""
+	if isinstance(profile, Profile):
+		return profile
+	if ft is not None:
+		return Profile.from_filetype(ft, profile)
+	return Profile.from_dict(None, profile or {})
+
+
+def expand(emmet, profile=None, jumps=False, max_elements=0, ft=None):
+	"""
+	Expand an abbreviation without vim.  profile is a Profile or a plain dict
+	as accepted by Profile.from_dict that, if ft is given, only overrides or
+	extends the shipped configuration of the file type ft, e.g. 'html'.
+	ExpansionTooLarge is raised if the output has more than max_elements
+	elements.
+	"""
+	profile = _dict_profile(profile, ft)
+	e = parse(emmet, profile)
+	if max_elements:
+		_guard(_size(e)['elements'], max_elements)
+	return e.tostr(Jumpcount(jumps))
+
+
+def estimate(emmet, profile=None, ft=None):
+	"""
+	Size of the expansion of an abbreviation without expanding it, a dict of
+	the number of tags, elements and attributes and the approximate number
+	of bytes.  profile and ft are the same as for expand.
+	"""
+	profile = _dict_profile(profile, ft)
+	return _size(parse(emmet, profile))
+
+
+def _common(a, b):
+	"""
+	Number of equal items at the start and at the end of the lists a and b,
+	the two ranges don't overlap
+	"""
+	n = min(len(a), len(b))
+	prefix = next(itertools.compress(itertools.count(), map(operator.ne, a, b)), n)
+	n -= prefix
+	suffix = next(itertools.compress(itertools.count(),
+		map(operator.ne, reversed(a), reversed(b))), n)
+	return prefix, min(suffix, n)
+
+
+class Preview():
+	"""
+	Text of a preview: its (level, line) tuples, the indented lines and the
+	indentation of the snippet they were made for
+	"""
+	__slots__ = ('lines', 'res', 'indent')
+
+	def __init__(self, lines, res, indent):
+		self.lines = lines
+		self.res = res
+		self.indent = indent
+
+
+def _append(snip, lines, previous=None):
+	"""
+	Append (level, line) tuples to the snippet in a single update.  The result
+	is the same as calling snip.shift(level) and snip += line for every line.
+
+	previous is the Preview of the last update.  Only the lines that differ
+	from it are indented again, usually just the tail of the abbreviation was
+	changed.  Returns the Preview of this update.
+	"""
+	# snip += starts with a new line, the indentation of the first line is
+	# therefore not adjusted by mkline
+	snip.rv += '\n'
+	snip.reset_indent()
+	base = snip.mkline()
+	snip.shift()
+	indent = (base, snip.mkline())
+	indents = {}
+
+	def mkline(level, line):
+		ind = indents.get(level)
+		if ind is None:
+			snip.reset_indent()
+			snip.shift(level)
+			ind = indents[level] = snip.mkline()
+		return ind + line
+
+	if previous is None or previous.indent != indent:
+		res = [mkline(level, line) for level, line in lines]
+	else:
+		old = previous.lines
+		prefix, suffix = _common(old, lines)
+		res = previous.res[:prefix]
+		res.extend([mkline(level, line) for level, line in lines[prefix:len(lines) - suffix]])
+		if suffix:
+			res.extend(previous.res[len(old) - suffix:])
+	snip.reset_indent()
+	snip.rv += '\n'.join(res)
+	return Preview(lines, res, indent)
+
+
+class Worker():
+	"""
+	Thread that expands abbreviations in the background.  Only the newest job
+	is kept, a running job checks regularly whether a newer one was submitted
+	and stops in that case.  Parser objects are not shared between threads,
+	the worker has its own.
+	"""
+	def __init__(self):
+		self.cond = threading.Condition()
+		self.generation = 0
+		self.job = None
+		# generation, expansion, error
+		self.result = (0, None, None)
+		self.parsers = {}
+		self.thread = threading.Thread(target=self._run, name='emmet')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def submit(self, job):
+		"""
+		Run job(cancelled) in the worker thread, returns the generation of the
+		job
+		"""
+		with self.cond:
+			self.generation += 1
+			self.job = (self.generation, job)
+			self.cond.notify_all()
+			return self.generation
+
+	def wait(self, generation, timeout=None):
+		"""
+		Wait for the job of generation, the result is an (expansion, error)
+		tuple or None if the job didn't finish in time or was superseded
+		"""
+		with self.cond:
+			self.cond.wait_for(lambda: self.result[0] >= generation or
+					self.generation != generation, timeout)
+			if self.result[0] == generation:
+				return self.result[1:]
+		return None
+
+	def _run(self):
+		while True:
+			with self.cond:
+				self.cond.wait_for(lambda: self.job is not None)
+				generation, job = self.job
+				self.job = None
+			try:
+				res = (generation, job(lambda: self.generation != generation), None)
+			except Cancelled:
 				continue
-			s += c
-		else:
-			if o and s:
-				ct = o(ct, s)
-				s = ''
-				o = None
-				o_trigger = c
-			o = operators[c](o, s) if o else operators[c]
-			if ct is e and s:
-				ct = e > Tag(s)
-				s = ''
-
-	# fall back, end of string reached
-	if s and (o or ct is e):
-		if ct is e:
-			e > Tag(s)
+			except Exception as err:
+				res = (generation, None, err)
+			with self.cond:
+				self.result = res
+				self.cond.notify_all()
+
+
+class Session():
+	"""
+	State of the engine: profiles, parsers, caches and the expansion that's
+	passed from write to post_jump.  The functions called by the snippets use
+	the default session SESSION, nothing else is shared between sessions.
+	The expansion server passes its own cache and template store.
+	"""
+	def __init__(self, cache=None, store=None):
+		# expansion for post_jump and the last one that was shown
+		self.expansion = None
+		self.last = None
+		self.preview = None
+		# generation of the worker's job that's still running
+		self.pending = None
+		# file name for capturing the next expansion by cProfile
+		self.capture = None
+		self.profiles = {}
+		self.parsers = {}
+		self.worker = None
+		# client of the expansion server and the time before which an
+		# unreachable server isn't asked again
+		self.client = None
+		self.retry = 0
+		self._cache = cache
+		self._store = store
+
+	def profile(self, ft):
+		"""
+		Profile of the file type, it's rebuilt only if the configuration changed
+		"""
+		version = _version(ft)
+		p = self.profiles.get(ft)
+		if p is None or p.version != version:
+			p = self.profiles[ft] = Profile.from_vim(ft, version)
+		return p
+
+	def cache(self):
+		if self._cache is None:
+			import vim
+			self._cache = ExpansionCache(int(vim.vars.get('emmet_cache_size', 64)))
+		return self._cache
+
+	def store(self):
+		"""
+		Template store of g:emmet_template_cache, None if it's not set.  It
+		keeps g:emmet_template_cache_size templates.
+		"""
+		import vim
+		path = vim.vars.get('emmet_template_cache')
+		if not path:
+			return None
+		path = os.path.expanduser(path.decode() if isinstance(path, bytes) else path)
+		size = int(vim.vars.get('emmet_template_cache_size', 1000))
+		if self._store is None or self._store.path != path or self._store.size != size:
+			self._store = TemplateStore(path, size)
+		return self._store
+
+	def flush(self):
+		self.profiles.clear()
+		self.parsers.clear()
+		if self.worker:
+			self.worker.parsers.clear()
+		if self._cache is not None:
+			self._cache.clear()
+
+	def _expand(self, emmet, profile, limit, max_elements, store, parsers, timing, cancelled=None):
+		"""
+		Create the expansion of the abbreviation, it runs in the worker thread
+		as well and must therefore not access vim
+		"""
+		tpl = store.get(emmet, profile) if store else None
+		if tpl is None:
+			# parser for live typing, a new one is created whenever the
+			# configuration changes
+			p = parsers.get(profile.ft)
+			if p is None or p.profile is not profile:
+				p = parsers[profile.ft] = Parser(profile)
+			e = p.parse(emmet)
+			timing('parse')
+			size = _size(e)
+			_guard(size['elements'], max_elements)
+			timing('estimate')
+			if cancelled and cancelled():
+				raise Cancelled()
+			tpl = Template.compile(e)
+			timing('compile')
+			timing.count(size)
 		else:
-			o(ct, s)
-	return e
+			_guard(tpl.elements(), max_elements)
+			timing.set(stored=True)
+		x = Expansion(tpl, limit, cancelled)
+		x.source = (emmet, profile)
+		timing('render')
+		return x
+
+	def _background(self, emmet, profile, limit, max_elements, store, key, deadline):
+		"""
+		Expand in the worker thread, None is returned if it doesn't finish
+		before the deadline
+		"""
+		if self.worker is None:
+			self.worker = Worker()
+		worker = self.worker
+		cache = self.cache()
+
+		def job(cancelled):
+			return cache.put(key, self._expand(emmet, profile, limit, max_elements,
+				store, worker.parsers, Timing(None, None, False), cancelled))
+
+		generation = worker.submit(job)
+		res = worker.wait(generation, deadline / 1000.0)
+		if res is None:
+			self.pending = generation
+			return None
+		x, err = res
+		if err:
+			raise err
+		return x
+
+	def _remote(self, path, emmet, profile, limit, max_elements):
+		"""
+		Expand by the server listening on path, None is returned if it isn't
+		reachable and the expansion has to be made in-process
+		"""
+		import emmet_server
+		if self.client is None or self.client.path != path:
+			if time.time() < self.retry:
+				return None
+			self.client = emmet_server.Client(path)
+		try:
+			return self.client.expand(emmet, profile, limit, max_elements)
+		except ExpansionTooLarge:
+			raise
+		except emmet_server.ServerError:
+			return None
+		except (OSError, ValueError):
+			self.client.close()
+			self.client = None
+			self.retry = time.time() + 5
+			return None
+
+	def write(self, t, snip):
+		if not t[1]:
+			snip += 'Syntax: http://docs.emmet.io/abbreviations/syntax/'
+			return
+		timing = _timing('write', t[1])
+		profiler = None
+		if self.capture:
+			import cProfile
+			profiler = cProfile.Profile()
+			profiler.enable()
+		try:
+			self.pending = None
+			cache = self.cache()
+			profile = self.profile(snip.ft)
+			limit = _limit()
+			max_elements = _max_elements()
+			store = self.store()
+			deadline = _background()
+			server = _server()
+			key = (t[1], snip.ft, profile.version, limit, max_elements)
+			timing('setup')
+			x = self._remote(server, t[1], profile, limit, max_elements) if server else None
+			if x is not None:
+				timing('server')
+			else:
+				x = cache.get(key)
+				if x is None and deadline:
+					x = self._background(t[1], profile, limit, max_elements, store, key, deadline)
+					timing('background')
+				elif x is None:
+					x = cache.put(key, self._expand(t[1], profile, limit, max_elements,
+						store, self.parsers, timing))
+				else:
+					timing.set(cached=True)
+			if x is None:
+				# the worker is still busy, the last preview is shown meanwhile
+				timing.set(pending=True)
+				self.expansion = None
+				x = self.last
+			else:
+				self.expansion = self.last = x
+			if x:
+				self.preview = _append(snip, x.preview, self.preview)
+				timing('snip')
+				timing.set(lines=len(x.lines), truncated=x.truncated)
+		except ExpansionTooLarge as err:
+			self.expansion = None
+			snip += str(err)
+		except Exception as err:
+			import traceback
+			snip += traceback.format_exc()
+		finally:
+			if profiler:
+				profiler.disable()
+				profiler.dump_stats(self.capture)
+				self.capture = None
+			timing.done(_log())
+
+	def post_jump(self, snip):
+		x = self.expansion
+		if self.pending:
+			# the user doesn't want to see a stale expansion
+			res = self.worker.wait(self.pending)
+			self.pending = None
+			x, err = res if res else (None, None)
+			if err:
+				# the stale preview is replaced by the error, as write shows it
+				if isinstance(err, ExpansionTooLarge):
+					msg = str(err)
+				else:
+					import traceback
+					msg = ''.join(traceback.format_exception(type(err), err, err.__traceback__))
+				snip.buffer[snip.snippet_start[0] + 1:snip.snippet_end[0] + 1] = \
+						msg.rstrip('\n').split('\n')
+				return
+			if x:
+				self.last = x
+		if x and (snip.snippet_start[0] + 1 < snip.snippet_end[0] or \
+				not snip.buffer[snip.snippet_end[0]].lstrip().startswith('Syntax: http://docs.emmet.io/abbreviations/syntax/')):
+			timing = _timing('post_jump', None)
+			# extract indentation
+			e_line = snip.buffer[snip.snippet_start[0]]
+			# delete first line
+			del snip.buffer[snip.snippet_start[0]:snip.snippet_end[0]]
+
+			i = e_line.index('#')
+			ind = ''
+			if i != -1:
+				ind = e_line[:i]
+			snip.buffer[snip.snippet_start[0]+1] = ind
+			timing('buffer')
+
+			jumps = x.jumps
+			timing('jumps')
+			snip.expand_anon(jumps)
+			timing('expand')
+			timing.set(lines=len(x.lines))
+			store = self.store()
+			if store and x.source:
+				try:
+					store.save(x.source[0], x.source[1], x.template)
+				except (IOError, OSError):
+					pass
+				timing('store')
+			timing.done(_log())
+
+
+SESSION = Session()
+
+
+def _profile(ft):
+	return SESSION.profile(ft)
+
+
+def capture_profile(path):
+	"""
+	Run the next expansion by the write function under cProfile and write the
+	statistics to path, e.g. :py3 emmet.capture_profile('/tmp/emmet.prof')
+	"""
+	SESSION.capture = path
+
+
+def flush_cache():
+	"""
+	Remove all cached expansions, e.g. :py3 emmet.flush_cache()
+	"""
+	SESSION.flush()
+
+
+def cache_stats():
+	"""
+	Hit and miss counters of the expansion cache, e.g.
+	:py3 print(emmet.cache_stats())
+	"""
+	return SESSION.cache().stats
 
 
 def write(t, snip):
 	"""
 	Entrance function called by the snippet
 	"""
-	global E
-	if not t[1]:
-		snip += 'Syntax: http://docs.emmet.io/abbreviations/syntax/'
-		return
-	try:
-		e = parse(t[1], snip.ft)
-		if e:
-			for line in str(e).split('\n'):
-				snip.reset_indent()
-				snip.shift(line.count('\t'))
-				snip += line.replace('\t', '')
-			E = e
-	except Exception as err:
-		import traceback
-		snip += traceback.format_exc()
+	SESSION.write(t, snip)
 
 
 def post_jump(snip):
@@ -486,17 +1926,98 @@ def post_jump(snip):
 	Called right before the user tries to jump to the first jump point.  It ends
 	the user's input and passes all jump points to UltiSnips
 	"""
-	if E and (snip.snippet_start[0] + 1 < snip.snippet_end[0] or \
-			not snip.buffer[snip.snippet_end[0]].lstrip().startswith('Syntax: http://docs.emmet.io/abbreviations/syntax/')):
-		# extract indentation
-		e_line = snip.buffer[snip.snippet_start[0]]
-		# delete first line
-		del snip.buffer[snip.snippet_start[0]:snip.snippet_end[0]]
+	SESSION.post_jump(snip)
+
+
+def _expand_line(args):
+	"""
+	Expand one line of input of the command line interface, runs in worker
+	processes as well
+	"""
+	emmet, profile, jumps, max_elements, size = args
+	try:
+		if size:
+			return emmet, estimate(emmet, profile), None
+		return emmet, expand(emmet, profile, jumps, max_elements), None
+	except Exception as err:
+		return emmet, None, '%s: %s' % (err.__class__.__name__, err)
+
+
+def main(argv=None):
+	"""
+	Command line interface, expands one abbreviation per line of input
+	"""
+	import argparse
+	import json
+	import sys
+
+	parser = argparse.ArgumentParser(
+			description='Expand emmet abbreviations, one per line of input.')
+	parser.add_argument('files', nargs='*', default=['-'],
+			help='files containing abbreviations, default: stdin')
+	parser.add_argument('-f', '--filetype', choices=sorted(PROFILES),
+			help='start from the shipped configuration of the file type')
+	parser.add_argument('-p', '--profile',
+			help='JSON file with default_attributes, inline_tags, '
+			'self_closing_tags, abbreviations and stacked_multiplication, '
+			'with --filetype it overrides the keys it contains and extends '
+			'the configuration with the *_extension keys')
+	parser.add_argument('--jumps', action='store_true',
+			help='include UltiSnips jump ids in the output')
+	parser.add_argument('--json', action='store_true',
+			help='write one JSON object per abbreviation')
+	parser.add_argument('--estimate', action='store_true',
+			help='write the estimated size of the expansion as JSON instead')
+	parser.add_argument('--max-elements', type=int, default=0,
+			help='refuse expansions with more elements, default: no limit')
+	parser.add_argument('-j', '--jobs', type=int, default=1,
+			help='number of worker processes')
+	args = parser.parse_args(argv)
+
+	profile = {}
+	if args.profile:
+		with open(args.profile) as f:
+			profile = json.load(f)
+	profile = _dict_profile(profile, args.filetype)
+
+	def lines():
+		for name in args.files:
+			f = sys.stdin if name == '-' else open(name)
+			try:
+				for line in f:
+					yield line.rstrip('\r\n'), profile, args.jumps, args.max_elements, args.estimate
+			finally:
+				if f is not sys.stdin:
+					f.close()
+
+	pool = None
+	if args.jobs > 1:
+		import multiprocessing
+		pool = multiprocessing.Pool(args.jobs)
+		results = pool.imap(_expand_line, lines(), chunksize=64)
+	else:
+		results = map(_expand_line, lines())
+
+	status = 0
+	try:
+		for emmet, res, err in results:
+			if err:
+				status = 1
+				sys.stderr.write('%s: %s\n' % (emmet, err))
+			elif args.estimate:
+				res['abbreviation'] = emmet
+				sys.stdout.write(json.dumps(res) + '\n')
+			elif args.json:
+				sys.stdout.write(json.dumps({'abbreviation': emmet, 'expansion': res}) + '\n')
+			else:
+				sys.stdout.write(res + '\n')
+	finally:
+		if pool:
+			pool.close()
+			pool.join()
+	return status
 
-		i = e_line.index('#')
-		ind = ''
-		if i != -1:
-			ind = e_line[:i]
-		snip.buffer[snip.snippet_start[0]+1] = ind
 
-		snip.expand_anon(E.tostr(Jumpcount(True)))
+if __name__ == '__main__':
+	import sys
+	sys.exit(main())
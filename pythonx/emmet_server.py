@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Depends: emmet
+#
+# MIT License
+#
+# Copyright (c) 2016 Jan Christoph Ebersbach
+# Homepage  http://www.e-jc.de/
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Long-lived expansion server that keeps profiles, parsers and expansions
+# warm across vim instances and is usable by other tools.  It speaks JSON-RPC
+# 2.0 with one message per line over stdio or a Unix socket.  Usage:
+#
+#   python3 pythonx/emmet_server.py --socket ~/.cache/emmet.sock
+#   python3 pythonx/emmet_server.py --stdio
+#
+# Methods:
+#
+#   expand       abbreviation, filetype, profile, limit, max_elements, jumps
+#   expand_many  abbreviations, filetype, profile, limit, max_elements, jumps
+#   stats
+#
+# profile is a dict as accepted by emmet.Profile.from_dict or the digest
+# that's returned by a previous request with that dict.  With filetype the
+# dict is merged with the shipped configuration of the file type as by
+# emmet.Profile.from_filetype.
+
+import asyncio
+import collections
+import json
+import os
+import signal
+import socket
+import sys
+import time
+
+import emmet
+
+
+# error codes of JSON-RPC and of the server
+PARSE_ERROR      = -32700
+INVALID_REQUEST  = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS   = -32602
+EXPANSION_FAILED = -32000
+TOO_LARGE        = -32001
+UNKNOWN_PROFILE  = -32002
+
+# maximum length of a message
+LIMIT = 16 * 1024 * 1024
+
+
+class ServerError(Exception):
+	"""
+	Error response of the server
+	"""
+	def __init__(self, code, message, data=None):
+		Exception.__init__(self, message)
+		self.code = code
+		self.data = data
+
+	def to_json(self):
+		res = {'code': self.code, 'message': str(self)}
+		if self.data is not None:
+			res['data'] = self.data
+		return res
+
+
+class Server():
+	"""
+	State shared by all clients: profiles by digest and a session with its
+	own expansion cache, parsers and template store.  Requests are handled in
+	the event loop one at a time, an expansion never runs concurrently with
+	another one.
+	"""
+	def __init__(self, cache_size=256, store=None, profile_cache_size=64):
+		self.session = emmet.Session(emmet.ExpansionCache(cache_size), store)
+		# profiles by digest, least recently used first
+		self.profiles = collections.OrderedDict()
+		self.profile_cache_size = profile_cache_size
+		self.started = time.time()
+		self.requests = 0
+		self.clients = 0
+		self.methods = {
+				'expand': self.expand,
+				'expand_many': self.expand_many,
+				'stats': self.stats,
+				}
+
+	def profile(self, params):
+		"""
+		Digest and profile of a request
+		"""
+		p = params.get('profile', {})
+		if isinstance(p, str):
+			profile = self.profiles.get(p)
+			if profile is None:
+				raise ServerError(UNKNOWN_PROFILE, 'Unknown profile: %s' % p)
+			self.profiles.move_to_end(p)
+			return p, profile
+		if not isinstance(p, dict):
+			raise ServerError(INVALID_PARAMS, 'profile must be a dict or a digest')
+		ft = params.get('filetype')
+		if ft is None:
+			profile = emmet.Profile.from_dict(None, p)
+		elif ft in emmet.PROFILES:
+			profile = emmet.Profile.from_filetype(ft, p)
+		else:
+			raise ServerError(INVALID_PARAMS, 'Unknown filetype: %s' % ft)
+		digest = profile.digest()
+		# the digest serves as file type, every configuration gets its own
+		# parser
+		if digest in self.profiles:
+			self.profiles.move_to_end(digest)
+		else:
+			self.profiles[digest] = profile._replace(ft=digest)
+		profile = self.profiles[digest]
+		# clients resend evicted profiles after an UNKNOWN_PROFILE error
+		while len(self.profiles) > self.profile_cache_size:
+			evicted, _ = self.profiles.popitem(last=False)
+			self.session.parsers.pop(evicted, None)
+		return digest, profile
+
+	def expand(self, params):
+		abbreviation = params.get('abbreviation')
+		if not isinstance(abbreviation, str):
+			raise ServerError(INVALID_PARAMS, 'abbreviation must be a string')
+		digest, profile = self.profile(params)
+		limit = int(params.get('limit', 0))
+		max_elements = int(params.get('max_elements', 0))
+		key = (abbreviation, digest, limit, max_elements)
+		session = self.session
+		cache = session.cache()
+		try:
+			x = cache.get(key)
+			if x is None:
+				x = cache.put(key, session._expand(abbreviation, profile, limit,
+					max_elements, session._store, session.parsers,
+					emmet.Timing(None, None, False)))
+			res = {'profile': digest, 'lines': x.preview, 'truncated': x.truncated}
+			if params.get('jumps'):
+				res['jumps'] = x.jumps
+				# like post_jump, only templates that are used are stored
+				if session._store:
+					try:
+						session._store.save(abbreviation, profile, x.template)
+					except (IOError, OSError):
+						pass
+		except emmet.ExpansionTooLarge as err:
+			raise ServerError(TOO_LARGE, str(err), {'elements': err.elements, 'limit': err.limit})
+		except Exception as err:
+			raise ServerError(EXPANSION_FAILED, '%s: %s' % (err.__class__.__name__, err))
+		return res
+
+	async def expand_many(self, params):
+		"""
+		Expand a list of abbreviations, a failed expansion is reported as
+		{'error': ...} in its place of the result.  Other clients are served
+		between two expansions.
+		"""
+		abbreviations = params.get('abbreviations')
+		if not isinstance(abbreviations, list):
+			raise ServerError(INVALID_PARAMS, 'abbreviations must be a list')
+		res = []
+		for a in abbreviations:
+			try:
+				res.append(self.expand(dict(params, abbreviation=a)))
+			except ServerError as err:
+				res.append({'error': err.to_json()})
+			await asyncio.sleep(0)
+		return res
+
+	def stats(self, params):
+		return {
+				'uptime': time.time() - self.started,
+				'requests': self.requests,
+				'clients': self.clients,
+				'profiles': len(self.profiles),
+				'cache': self.session.cache().stats,
+				}
+
+	async def dispatch(self, line):
+		"""
+		Handle a single request, returns the response or None for
+		notifications
+		"""
+		self.requests += 1
+		try:
+			req = json.loads(line)
+		except ValueError:
+			return {'jsonrpc': '2.0', 'id': None,
+					'error': ServerError(PARSE_ERROR, 'Parse error').to_json()}
+		rid = req.get('id') if isinstance(req, dict) else None
+		try:
+			if not isinstance(req, dict) or not isinstance(req.get('method'), str):
+				raise ServerError(INVALID_REQUEST, 'Invalid request')
+			method = self.methods.get(req['method'])
+			if method is None:
+				raise ServerError(METHOD_NOT_FOUND, 'Method not found: %s' % req['method'])
+			params = req.get('params', {})
+			if not isinstance(params, dict):
+				raise ServerError(INVALID_PARAMS, 'params must be an object')
+			result = method(params)
+			if asyncio.iscoroutine(result):
+				result = await result
+			res = {'jsonrpc': '2.0', 'id': rid, 'result': result}
+		except ServerError as err:
+			res = {'jsonrpc': '2.0', 'id': rid, 'error': err.to_json()}
+		except (ValueError, TypeError) as err:
+			res = {'jsonrpc': '2.0', 'id': rid,
+					'error': ServerError(INVALID_PARAMS, str(err)).to_json()}
+		if isinstance(req, dict) and 'id' not in req:
+			return None
+		return res
+
+	async def handle(self, reader, writer):
+		"""
+		Serve one client until it closes the connection
+		"""
+		self.clients += 1
+		try:
+			while True:
+				try:
+					line = await reader.readline()
+				except ValueError:
+					# message exceeds LIMIT
+					break
+				if not line:
+					break
+				if not line.strip():
+					continue
+				res = await self.dispatch(line)
+				if res is not None:
+					writer.write(json.dumps(res).encode('utf-8') + b'\n')
+					await writer.drain()
+		except ConnectionError:
+			pass
+		except asyncio.CancelledError:
+			# the server is shutting down, the connection just ends
+			pass
+		finally:
+			self.clients -= 1
+			writer.close()
+
+	async def serve_unix(self, path):
+		"""
+		Listen on the Unix socket path, a stale socket of a server that's no
+		longer running is replaced
+		"""
+		if os.path.exists(path):
+			s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				s.connect(path)
+			except OSError:
+				os.unlink(path)
+			else:
+				raise OSError('server is already running: %s' % path)
+			finally:
+				s.close()
+		# the socket is only accessible by the user from the moment it's
+		# created
+		umask = os.umask(0o077)
+		try:
+			server = await asyncio.start_unix_server(self.handle, path, limit=LIMIT)
+		finally:
+			os.umask(umask)
+		asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+		try:
+			async with server:
+				await server.serve_forever()
+		finally:
+			os.unlink(path)
+
+	async def serve_stdio(self):
+		"""
+		Serve a single client connected to stdin and stdout
+		"""
+		stdio = _Stdio()
+		await self.handle(stdio, stdio)
+
+
+class _Stdio():
+	"""
+	Reader and writer of stdin and stdout for Server.handle.  stdin is read
+	in a thread, unlike asyncio's pipe transports this works for redirected
+	files as well.
+	"""
+	async def readline(self):
+		return await asyncio.get_running_loop().run_in_executor(None, sys.stdin.buffer.readline)
+
+	def write(self, data):
+		sys.stdout.buffer.write(data)
+
+	async def drain(self):
+		sys.stdout.buffer.flush()
+
+	def close(self):
+		pass
+
+
+class Remote():
+	"""
+	Expansion made by the server, it's used by emmet.write and
+	emmet.post_jump in place of an emmet.Expansion.  The text for post_jump is
+	requested when it's needed, it's made in-process if the server is gone
+	by then.
+	"""
+	def __init__(self, client, abbreviation, profile, limit, max_elements, result):
+		self.lines = [tuple(l) for l in result['lines']]
+		self.preview = self.lines
+		self.truncated = result['truncated']
+		self.template = None
+		self.source = None
+		self._args = (client, abbreviation, profile, limit, max_elements)
+		self._jumps = result.get('jumps')
+
+	@property
+	def jumps(self):
+		if self._jumps is None:
+			client, abbreviation, profile, limit, max_elements = self._args
+			try:
+				self._jumps = client.expand(abbreviation, profile, limit,
+						max_elements, jumps=True)._jumps
+			except (OSError, ValueError, ServerError):
+				self._jumps = emmet.Expansion(emmet.parse(abbreviation, profile)).jumps
+		return self._jumps
+
+
+class Client():
+	"""
+	Blocking client of the server, used by the vim snippets.  Profiles are
+	sent once, later requests refer to them by their digest.
+	"""
+	def __init__(self, path, timeout=2.0):
+		self.path = path
+		self.timeout = timeout
+		self.sock = None
+		self.file = None
+		self.id = 0
+		# file type: profile and its digest
+		self.digests = {}
+		# digests known by the server
+		self.known = set()
+
+	def close(self):
+		if self.sock is not None:
+			self.file.close()
+			self.sock.close()
+			self.sock = None
+			self.file = None
+
+	def call(self, method, params):
+		"""
+		Send a request and wait for its response.  OSError is raised if the
+		server isn't reachable, ServerError if it returns an error.
+		"""
+		if self.sock is None:
+			sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			sock.settimeout(self.timeout)
+			try:
+				sock.connect(self.path)
+			except OSError:
+				sock.close()
+				raise
+			self.sock = sock
+			self.file = sock.makefile('rwb')
+			self.known.clear()
+		self.id += 1
+		try:
+			self.file.write(json.dumps({'jsonrpc': '2.0', 'id': self.id,
+				'method': method, 'params': params}).encode('utf-8') + b'\n')
+			self.file.flush()
+			line = self.file.readline()
+			if not line:
+				raise ConnectionError('connection closed by server')
+			res = json.loads(line)
+		except (OSError, ValueError):
+			# a late response mustn't be taken for the next one
+			self.close()
+			raise
+		if 'error' in res:
+			err = res['error']
+			raise ServerError(err['code'], err['message'], err.get('data'))
+		return res['result']
+
+	def digest(self, profile):
+		p = self.digests.get(profile.ft)
+		if p is None or p[0] is not profile:
+			p = self.digests[profile.ft] = (profile, profile.digest())
+		return p[1]
+
+	def expand(self, abbreviation, profile, limit=0, max_elements=0, jumps=False):
+		"""
+		Expand abbreviation with an emmet.Profile, ExpansionTooLarge is raised
+		like for in-process expansions
+		"""
+		digest = self.digest(profile)
+		params = {'abbreviation': abbreviation, 'limit': limit,
+				'max_elements': max_elements, 'jumps': jumps}
+		params['profile'] = digest if digest in self.known else profile.to_dict()
+		try:
+			res = self.call('expand', params)
+		except ServerError as err:
+			if err.code == TOO_LARGE:
+				raise emmet.ExpansionTooLarge(err.data['elements'], err.data['limit'])
+			if err.code != UNKNOWN_PROFILE:
+				raise
+			# the server was restarted
+			params['profile'] = profile.to_dict()
+			res = self.call('expand', params)
+		self.known.add(res['profile'])
+		return Remote(self, abbreviation, profile, limit, max_elements, res)
+
+	def stats(self):
+		return self.call('stats', {})
+
+
+def main(argv=None):
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Serve emmet expansions via JSON-RPC.')
+	group = parser.add_mutually_exclusive_group(required=True)
+	group.add_argument('--socket', help='listen on this Unix socket')
+	group.add_argument('--stdio', action='store_true', help='serve a single client on stdin and stdout')
+	parser.add_argument('--cache-size', type=int, default=256,
+			help='number of cached expansions')
+	parser.add_argument('--profile-cache-size', type=int, default=64,
+			help='number of kept profiles, clients resend evicted ones')
+	parser.add_argument('--template-cache',
+			help='file of compiled templates, shared with g:emmet_template_cache')
+	parser.add_argument('--template-cache-size', type=int, default=1000,
+			help='number of stored templates')
+	args = parser.parse_args(argv)
+
+	store = None
+	if args.template_cache:
+		store = emmet.TemplateStore(os.path.expanduser(args.template_cache),
+				args.template_cache_size)
+	server = Server(args.cache_size, store, args.profile_cache_size)
+	try:
+		if args.socket:
+			asyncio.run(server.serve_unix(os.path.expanduser(args.socket)))
+		else:
+			asyncio.run(server.serve_stdio())
+	except (KeyboardInterrupt, asyncio.CancelledError):
+		pass
+	except OSError as err:
+		sys.stderr.write('%s\n' % err)
+		return 1
+	finally:
+		if store:
+			store.flush()
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
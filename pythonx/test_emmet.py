@@ -94,6 +94,9 @@ tests = {
 										'<html>\n\t<body id="${2:body}" class="${3:exer}">$4</body>\n</html>\n<html>\n\t<body id="${5:body}" class="${6:exer}">$7</body>\n</html>'),
 		'html*2>body#body.exer.cise': ('<html>\n\t<body id="body" class="exer cise"></body>\n</html>\n<html>\n\t<body id="body" class="exer cise"></body>\n</html>',
 										'<html>\n\t<body id="${2:body}" class="${3:exer cise}">$4</body>\n</html>\n<html>\n\t<body id="${5:body}" class="${6:exer cise}">$7</body>\n</html>'),
+		# repeated multiplication repeats each numbered copy
+		'p.c$*2*2':                   ('<p class="c1"></p>\n<p class="c1"></p>\n<p class="c2"></p>\n<p class="c2"></p>',
+										'<p class="${2:c1}">$3</p>\n<p class="${4:c1}">$5</p>\n<p class="${6:c2}">$7</p>\n<p class="${8:c2}">$9</p>'),
 		# test parent stacking
 		'html*2>body^html2':          ('<html>\n\t<body></body>\n</html>\n<html>\n\t<body></body>\n</html>\n<html2></html2>',
 										'<html>\n\t<body>$2</body>\n</html>\n<html>\n\t<body>$3</body>\n</html>\n<html2>$4</html2>'),
@@ -129,12 +132,20 @@ tests = {
 											'<html>${2:text1}\n\t<body>\n\t\t<p>${3:text1}</p>\n\t</body>\n\t<head>$4</head>\n</html>'),
 		'ul*2>li.item$*2{item nr. $}':    ('<ul>\n\t<li class="item1">item nr. 1</li>\n\t<li class="item2">item nr. 2</li>\n</ul>\n<ul>\n\t<li class="item1">item nr. 1</li>\n\t<li class="item2">item nr. 2</li>\n</ul>',
 											'<ul>\n\t<li class="${2:item1}">${3:item nr. 1}</li>\n\t<li class="${4:item2}">${5:item nr. 2}</li>\n</ul>\n<ul>\n\t<li class="${6:item1}">${7:item nr. 1}</li>\n\t<li class="${8:item2}">${9:item nr. 2}</li>\n</ul>'),
+		'p{hello world}':                 ('<p>hello world</p>',
+											'<p>${2:hello world}</p>'),
 
 		# custom attributes
 		'td.test[title colspan=3]':                       ('<td class="test" title="" colspan="3"></td>',
 															'<td class="${2:test}" title="$3" colspan="${4:3}">$5</td>'),
 		'td.test[title="nr $" colspan=3]':                       ('<td class="test" title="nr 1" colspan="3"></td>',
 															'<td class="${2:test}" title="${3:nr 1}" colspan="${4:3}">$5</td>'),
+		'x[a=1 b="2"]':                       ('<x a="1" b="2"></x>',
+												'<x a="${2:1}" b="${3:2}">$4</x>'),
+		'x[a="x\'s"]':                        ('<x a="x\'s"></x>',
+												'<x a="${2:x\'s}">$3</x>'),
+		'x[a=1"2" b="c"d]':                   ('<x a="12" b="cd"></x>',
+												'<x a="${2:12}" b="${3:cd}">$4</x>'),
 		'a[href="nr$"]':                       ('<a href="nr1"></a>',
 												'<a href="${2:nr1}">$3</a>'),
 		'td.test[title="Hello world!" colspan=3]':        ('<td class="test" title="Hello world!" colspan="3"></td>',
@@ -174,6 +185,29 @@ tests = {
 		'bq>a>fig':       ('<blockquote><a href=""><figure></figure></a></blockquote>',
 							'<blockquote><a href="$2"><figure>$3</figure></a></blockquote>'),
 
+		# grouping
+		'(p>span)*2+div':       ('<p>\n\t<span></span>\n</p>\n<p>\n\t<span></span>\n</p>\n<div></div>',
+								'<p>\n\t<span>$2</span>\n</p>\n<p>\n\t<span>$3</span>\n</p>\n<div>$4</div>'),
+		'div>(header>p)+footer':       ('<div>\n\t<header>\n\t\t<p></p>\n\t</header>\n\t<footer></footer>\n</div>',
+										'<div>\n\t<header>\n\t\t<p>$2</p>\n\t</header>\n\t<footer>$3</footer>\n</div>'),
+		'ul>(li.item$)*3':       ('<ul>\n\t<li class="item1"></li>\n\t<li class="item2"></li>\n\t<li class="item3"></li>\n</ul>',
+								'<ul>\n\t<li class="${2:item1}">$3</li>\n\t<li class="${4:item2}">$5</li>\n\t<li class="${6:item3}">$7</li>\n</ul>'),
+		'table>(tr>td*2)*2':       ('<table>\n\t<tr>\n\t\t<td></td>\n\t\t<td></td>\n\t</tr>\n\t<tr>\n\t\t<td></td>\n\t\t<td></td>\n\t</tr>\n</table>',
+									'<table>\n\t<tr>\n\t\t<td>$2</td>\n\t\t<td>$3</td>\n\t</tr>\n\t<tr>\n\t\t<td>$4</td>\n\t\t<td>$5</td>\n\t</tr>\n</table>'),
+		'()+p':       ('<p></p>',
+					'<p>$2</p>'),
+		# a group right after a tag is its sibling
+		'div>p(span)':       ('<div>\n\t<p></p>\n\t<span></span>\n</div>',
+							'<div>\n\t<p>$2</p>\n\t<span>$3</span>\n</div>'),
+		'ul>li(a)*2':       ('<ul>\n\t<li></li>\n\t<a href=""></a>\n\t<a href=""></a>\n</ul>',
+							'<ul>\n\t<li>$2</li>\n\t<a href="$3">$4</a>\n\t<a href="$5">$6</a>\n</ul>'),
+
+		# numbering base and direction
+		'ul>li.item$@-*3':       ('<ul>\n\t<li class="item3"></li>\n\t<li class="item2"></li>\n\t<li class="item1"></li>\n</ul>',
+								'<ul>\n\t<li class="${2:item3}">$3</li>\n\t<li class="${4:item2}">$5</li>\n\t<li class="${6:item1}">$7</li>\n</ul>'),
+		'p.c$$@3*2{$@-}':       ('<p class="c03">2</p>\n<p class="c04">1</p>',
+								'<p class="${2:c03}">${3:2}</p>\n<p class="${4:c04}">${5:1}</p>'),
+
 		# error handling
 		# --------------
 
@@ -183,6 +217,17 @@ tests = {
 		'html > body': ('<html>\n\t<body></body>\n</html>',
 						'<html>\n\t<body>$2</body>\n</html>'),
 
+		# groups have neither attributes nor text
+		'(p).c':    ValueError,
+		'(p){t}':   ValueError,
+		'(p)[x=1]': ValueError,
+		'(p#a)#b':  ValueError,
+
+		# a tag has at least one copy
+		'p*0':    ValueError,
+		'p*-3':   ValueError,
+		'(p)*-3': ValueError,
+
 		# test wrong input
 		# '{text}': ('<html>text</html>',
 		#					'<html>text</html>'),
@@ -216,28 +261,61 @@ test_results = {
 		}
 
 
+def results(emmet_input, ft):
+	"""
+	Output of all ways of rendering the abbreviation, yields (renderer,
+	output, output with jumps) tuples: the tree renderer, the compiled
+	template that's used by write and the resumable Parser fed one character
+	at a time
+	"""
+	e = emmet.parse(emmet_input, ft)
+	yield 'tree', str(e), e.tostr(emmet.Jumpcount(True))
+	lines = list(emmet.Template.compile(e).render())
+	yield 'template', '\n'.join(['\t' * l[0] + l[1] for l in lines]), \
+			'\n'.join(['\t' * l[0] + l[2] for l in lines])
+	p = emmet.Parser(ft if isinstance(ft, emmet.Profile) else emmet._profile(ft))
+	for i in range(1, len(emmet_input) + 1):
+		e = p.parse(emmet_input[:i])
+	yield 'incremental', str(e), e.tostr(emmet.Jumpcount(True))
+
+
+def rejected(emmet_input, ft, error):
+	"""
+	Whether the abbreviation is rejected with error by parse and by the
+	resumable Parser fed one character at a time
+	"""
+	p = emmet.Parser(ft if isinstance(ft, emmet.Profile) else emmet._profile(ft))
+	for i in range(1, len(emmet_input)):
+		try:
+			p.parse(emmet_input[:i])
+		except error:
+			pass
+	for parse in (lambda: emmet.parse(emmet_input, ft), lambda: p.parse(emmet_input)):
+		try:
+			parse()
+		except error:
+			continue
+		return False
+	return True
+
+
 def test_write(t, snip):
 	for k, v in tests.items():
 		try:
-			e = emmet.parse(k, snip.ft)
-			r = str(e) 
-			ok = r == v[0]
-			snip += '%s: %s' % (k, test_results[ok])
-			if not ok:
-				snip += '---------------- got:'
-				snip += r
-				snip += '---------------- expected:'
-				snip += v[0]
-				snip += '----------------'
-			r = e.tostr(emmet.Jumpcount(True))
-			ok = r == v[1]
-			snip += '(jumps) %s: %s' % (k, test_results[ok])
-			if not ok:
-				snip += '---------------- got:'
-				snip += r
-				snip += '---------------- expected:'
-				snip += v[1]
-				snip += '----------------'
+			if isinstance(v, type):
+				# invalid input, the expectation is the exception
+				snip += 'rejected %s: %s' % (k, test_results[rejected(k, snip.ft, v)])
+				continue
+			for renderer, r, jr in results(k, snip.ft):
+				for label, r, expected in (('', r, v[0]), ('(jumps) ', jr, v[1])):
+					ok = r == expected
+					snip += '%s%s %s: %s' % (label, renderer, k, test_results[ok])
+					if not ok:
+						snip += '---------------- got:'
+						snip += r
+						snip += '---------------- expected:'
+						snip += expected
+						snip += '----------------'
 		except Exception as err:
 			import traceback
 			snip += '%s: %s' % (k, test_results[False])